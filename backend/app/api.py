@@ -3,6 +3,7 @@ from supabase._async.client import AsyncClient
 
 from app.core.supabase import get_async_supabase
 from app.routes.classification_routes import router as classification_router
+from app.routes.metrics_routes import router as metrics_router
 from app.routes.migration_routes import router as migration_router
 from app.routes.pattern_recognition_routes import router as pattern_recognition_router
 from app.routes.preprocess_routes import router as preprocess_router
@@ -25,3 +26,4 @@ api_router.include_router(preprocess_router)
 api_router.include_router(webhook_router)
 api_router.include_router(pattern_recognition_router)
 api_router.include_router(migration_router)
+api_router.include_router(metrics_router)
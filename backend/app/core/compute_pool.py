@@ -0,0 +1,182 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from collections.abc import Awaitable, Callable
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import suppress
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, TypeVar
+
+import numpy as np
+from fastapi import HTTPException, Request
+
+T = TypeVar("T")
+
+# Worker processes for CPU-bound numeric work (UMAP, HDBSCAN, DBSCAN), so it
+# never runs on the event loop
+COMPUTE_POOL_WORKERS = max(1, int(os.getenv("COMPUTE_POOL_WORKERS", 2)))
+# Recycle workers after this many jobs to return memory held by the ML stack
+COMPUTE_POOL_MAX_TASKS_PER_CHILD = int(
+    os.getenv("COMPUTE_POOL_MAX_TASKS_PER_CHILD", 20)
+)
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+class ComputeCancelled(Exception):
+    """Raised inside a worker when its job was cancelled by the caller"""
+
+
+@dataclass(frozen=True)
+class SharedArray:
+    """Picklable handle to an array placed in shared memory for a job"""
+
+    name: str
+    shape: tuple[int, ...]
+    dtype: str
+
+
+class _Job:
+    """Parent-side shared memory of one job: its arrays and cancel flag"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._released = False
+        self.cancel_flag = SharedMemory(create=True, size=1)
+        self.cancel_flag.buf[0] = 0
+        self.segments = [self.cancel_flag]
+
+    def share(self, array: np.ndarray) -> SharedArray:
+        shm = SharedMemory(create=True, size=max(1, array.nbytes))
+        self.segments.append(shm)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        return SharedArray(shm.name, array.shape, array.dtype.str)
+
+    def cancel(self) -> None:
+        with self._lock:
+            if not self._released:
+                self.cancel_flag.buf[0] = 1
+
+    def release(self, _: Future | None = None) -> None:
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+            for shm in self.segments:
+                shm.close()
+                shm.unlink()
+
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def get_compute_pool() -> ProcessPoolExecutor:
+    """Process-wide pool, started on first use"""
+    global _pool
+    if _pool is None:
+        # spawn: forking a process with running threads (asyncio, numba) is unsafe
+        _pool = ProcessPoolExecutor(
+            max_workers=COMPUTE_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            max_tasks_per_child=COMPUTE_POOL_MAX_TASKS_PER_CHILD,
+        )
+        print(f"Compute pool: {COMPUTE_POOL_WORKERS} workers", flush=True)
+    return _pool
+
+
+def shutdown_compute_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def run_compute(fn: Callable[..., T], *args: Any) -> T:
+    """
+    Run fn(*args) in the compute pool. fn must be a module-level function.
+    numpy array arguments are passed through shared memory rather than
+    pickled; the worker receives read-write views of job-private copies.
+
+    Cancelling the awaiting task cancels a queued job outright; a running
+    job stops at its next raise_if_cancelled() checkpoint.
+    """
+    job = _Job()
+    try:
+        job_args = await asyncio.to_thread(
+            lambda: [job.share(a) if isinstance(a, np.ndarray) else a for a in args]
+        )
+        future = get_compute_pool().submit(_run_job, fn, job.cancel_flag.name, job_args)
+    except BaseException:
+        job.release()
+        raise
+    future.add_done_callback(job.release)
+
+    try:
+        return await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        job.cancel()
+        future.cancel()
+        raise
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed); start a fresh pool next time
+        shutdown_compute_pool()
+        raise
+
+
+async def run_until_disconnected(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    Await awaitable, cancelling it (and any compute job it is waiting on)
+    if the HTTP client disconnects first
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                print(f"Client disconnected, cancelling {request.url.path}", flush=True)
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
+
+# Worker side: the cancel flag of the job currently running in this process
+_cancel_flag: SharedMemory | None = None
+
+
+def raise_if_cancelled() -> None:
+    """Checkpoint for long jobs; a no-op outside the compute pool"""
+    if _cancel_flag is not None and _cancel_flag.buf[0]:
+        raise ComputeCancelled()
+
+
+def _run_job(fn: Callable[..., T], cancel_flag_name: str, job_args: list) -> T:
+    global _cancel_flag
+    segments = []
+    try:
+        _cancel_flag = SharedMemory(name=cancel_flag_name)
+        segments.append(_cancel_flag)
+        raise_if_cancelled()
+
+        args = []
+        for arg in job_args:
+            if isinstance(arg, SharedArray):
+                shm = SharedMemory(name=arg.name)
+                segments.append(shm)
+                arg = np.ndarray(arg.shape, dtype=arg.dtype, buffer=shm.buf)
+            args.append(arg)
+
+        return fn(*args)
+    finally:
+        _cancel_flag = None
+        args = arg = None
+        for shm in segments:
+            # A result still viewing shared memory keeps the mapping open
+            with suppress(BufferError):
+                shm.close()
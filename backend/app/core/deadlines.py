@@ -0,0 +1,63 @@
+import json
+import os
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bound on a single LLM call (including queueing for the rate limiter,
+# retries and hedges) per pipeline stage; override with
+# LLM_STAGE_TIMEOUTS='{"<stage>": seconds}'
+DEFAULT_STAGE_TIMEOUTS = {
+    "default": 120.0,
+    "extraction": 300.0,
+    "document_embedding": 60.0,
+    "embedding": 60.0,
+    "classification": 60.0,
+    "cluster_naming": 60.0,
+    "relationship_analysis": 180.0,
+}
+
+_stage_timeouts = {
+    **DEFAULT_STAGE_TIMEOUTS,
+    **json.loads(os.getenv("LLM_STAGE_TIMEOUTS", "{}")),
+}
+
+# Absolute time.monotonic() by which the current unit of work must finish
+_deadline: ContextVar[float | None] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: float) -> Iterator[None]:
+    """
+    Bound everything awaited inside the block (and tasks it spawns) by a
+    deadline. Nested scopes can only shorten an enclosing deadline.
+    """
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_seconds() -> float | None:
+    """Seconds left before the current deadline, or None if there is none"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def call_timeout(stage: str) -> float:
+    """
+    Timeout for one LLM call in a stage: the stage's own bound, shortened to
+    whatever remains of the enclosing deadline. Raises TimeoutError if the
+    deadline has already passed.
+    """
+    timeout = _stage_timeouts.get(stage, _stage_timeouts["default"])
+    remaining = remaining_seconds()
+    if remaining is None:
+        return timeout
+    if remaining <= 0:
+        raise TimeoutError(f"Deadline exceeded before {stage} call")
+    return min(timeout, remaining)
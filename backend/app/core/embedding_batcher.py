@@ -0,0 +1,109 @@
+import asyncio
+import os
+
+from litellm.types.utils import EmbeddingResponse
+
+from app.core.llm_provider import get_llm_provider
+from app.core.rate_limiter import estimate_tokens, get_rate_limiter
+
+# How long to wait for concurrent callers before sending a partial batch
+BATCH_WINDOW_SECONDS = int(os.getenv("EMBED_BATCH_WINDOW_MS", 5)) / 1000
+# Gemini's batchEmbedContents accepts at most 100 inputs per request
+MAX_BATCH_SIZE = max(1, int(os.getenv("EMBED_MAX_BATCH_SIZE", 100)))
+# A batch is shared by several callers, so it has its own timeout
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("EMBED_REQUEST_TIMEOUT_SECONDS", 60))
+
+
+class EmbeddingBatcher:
+    """
+    Dynamic micro-batcher for one embedding model.
+
+    Inputs from concurrent callers are collected for up to BATCH_WINDOW_SECONDS
+    (or until MAX_BATCH_SIZE inputs are pending), sent as one aembedding
+    request, and the resulting vectors are fanned back out to each caller.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        dimensions: int,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        window_seconds: float = BATCH_WINDOW_SECONDS,
+    ):
+        self.model = model
+        self.dimensions = dimensions
+        self.max_batch_size = max_batch_size
+        self.window_seconds = window_seconds
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._requests: set[asyncio.Task] = set()
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        """Embed texts, sharing requests with any other concurrent callers"""
+        loop = asyncio.get_running_loop()
+        futures = []
+
+        for text in texts:
+            future = loop.create_future()
+            self._pending.append((text, future))
+            futures.append(future)
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+
+        if self._pending and self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush)
+
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self) -> None:
+        """Send every full batch now and whatever partial batch remains"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending:
+            batch = self._pending[: self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size :]
+
+            request = asyncio.create_task(self._send(batch))
+            self._requests.add(request)
+            request.add_done_callback(self._requests.discard)
+
+    async def _send(self, batch: list[tuple[str, asyncio.Future]]) -> None:
+        # Identical texts in one batch are only embedded once
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+
+        try:
+            response: EmbeddingResponse = await get_rate_limiter(self.model).call(
+                lambda: get_llm_provider().aembedding(
+                    model=self.model,
+                    input=unique_texts,
+                    dimensions=self.dimensions,
+                    timeout=REQUEST_TIMEOUT_SECONDS,
+                ),
+                estimated_tokens=sum(estimate_tokens(text) for text in unique_texts),
+            )
+            vectors = {
+                text: data.embedding
+                for text, data in zip(unique_texts, response.data, strict=True)
+            }
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for text, future in batch:
+            if not future.done():
+                future.set_result(vectors[text])
+
+
+_batchers: dict[tuple[str, int], EmbeddingBatcher] = {}
+
+
+def get_embedding_batcher(model: str, dimensions: int) -> EmbeddingBatcher:
+    """Shared batcher per (model, dimensions) so every LLMClient batches together"""
+    key = (model, dimensions)
+    if key not in _batchers:
+        _batchers[key] = EmbeddingBatcher(model, dimensions)
+    return _batchers[key]
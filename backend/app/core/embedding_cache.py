@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+from supabase._async.client import AsyncClient
+
+MAX_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 50_000))
+# PostgREST filters are sent in the URL, so look up hashes in chunks
+_DB_LOOKUP_CHUNK = 100
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed on (embedding_model, dimensions, sha256(text)).
+
+    Tier 1 is an in-process LRU capped at MAX_MEMORY_ENTRIES, holding float32
+    arrays (~3 KiB per 768-d vector rather than ~25 KiB as a list of floats,
+    and the same precision as pgvector); tier 2 is the embedding_cache table,
+    shared by every process once configure() is called.
+    Cache failures are logged and treated as misses, never raised.
+    """
+
+    def __init__(self, max_entries: int = MAX_MEMORY_ENTRIES):
+        self.max_entries = max_entries
+        self.supabase: AsyncClient | None = None
+        self._memory: OrderedDict[tuple[str, int, str], np.ndarray] = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def configure(self, supabase: AsyncClient) -> None:
+        """Enable the persistent tier"""
+        self.supabase = supabase
+
+    async def get_many(
+        self, model: str, dimensions: int, texts: list[str]
+    ) -> dict[str, list[float]]:
+        """Return cached embeddings for whichever texts are cached"""
+        found: dict[str, list[float]] = {}
+        missing: dict[str, str] = {}
+
+        for text in dict.fromkeys(texts):
+            key = (model, dimensions, text_hash(text))
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                found[text] = self._memory[key].tolist()
+                self.memory_hits += 1
+            else:
+                missing[key[2]] = text
+
+        from_db = (
+            await self._get_from_db(model, dimensions, missing)
+            if missing and self.supabase is not None
+            else {}
+        )
+        for text, embedding in from_db.items():
+            found[text] = embedding
+            self._remember(model, dimensions, text, embedding)
+
+        self.db_hits += len(from_db)
+        self.misses += len(missing) - len(from_db)
+        return found
+
+    async def put_many(
+        self, model: str, dimensions: int, embeddings: dict[str, list[float]]
+    ) -> None:
+        """Store freshly generated embeddings in both tiers"""
+        for text, embedding in embeddings.items():
+            self._remember(model, dimensions, text, embedding)
+
+        if not embeddings or self.supabase is None:
+            return
+
+        try:
+            await (
+                self.supabase.table("embedding_cache")
+                .upsert(
+                    [
+                        {
+                            "embedding_model": model,
+                            "dimensions": dimensions,
+                            "text_sha256": text_hash(text),
+                            "embedding": embedding,
+                        }
+                        for text, embedding in embeddings.items()
+                    ]
+                )
+                .execute()
+            )
+        except Exception as e:
+            print(f"Failed to persist embeddings: {e}", flush=True)
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "max_memory_entries": self.max_entries,
+            "persistent": self.supabase is not None,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.db_hits) / lookups if lookups else 0.0,
+        }
+
+    def _remember(
+        self, model: str, dimensions: int, text: str, embedding: list[float]
+    ) -> None:
+        key = (model, dimensions, text_hash(text))
+        self._memory[key] = np.asarray(embedding, dtype=np.float32)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def _get_from_db(
+        self, model: str, dimensions: int, texts_by_hash: dict[str, str]
+    ) -> dict[str, list[float]]:
+        hashes = list(texts_by_hash)
+        found = {}
+        try:
+            for start in range(0, len(hashes), _DB_LOOKUP_CHUNK):
+                response = await (
+                    self.supabase.table("embedding_cache")
+                    .select("text_sha256, embedding")
+                    .eq("embedding_model", model)
+                    .eq("dimensions", dimensions)
+                    .in_("text_sha256", hashes[start : start + _DB_LOOKUP_CHUNK])
+                    .execute()
+                )
+                for row in response.data or []:
+                    embedding = row["embedding"]
+                    found[texts_by_hash[row["text_sha256"]]] = (
+                        json.loads(embedding)
+                        if isinstance(embedding, str)
+                        else embedding
+                    )
+        except Exception as e:
+            print(f"Embedding cache lookup failed: {e}", flush=True)
+        return found
+
+
+_cache = EmbeddingCache()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    return _cache
+
+
+def configure_embedding_cache(supabase: AsyncClient) -> None:
+    _cache.configure(supabase)
+    print("Embedding Cache Initialized")
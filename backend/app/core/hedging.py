@@ -0,0 +1,89 @@
+import asyncio
+import os
+from collections import deque
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+T = TypeVar("T")
+
+# Hedging is opt-in: a duplicate request costs quota and tokens
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false") == "true"
+HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", 0.95))
+# Don't hedge until enough latencies have been seen to trust the quantile
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", 1.0))
+LATENCY_WINDOW = 500
+
+
+class LatencyTracker:
+    """Sliding window of recent successful call latencies per (model, stage)"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._latencies: dict[tuple[str, str], deque[float]] = {}
+
+    def observe(self, key: tuple[str, str], seconds: float) -> None:
+        self._latencies.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, key: tuple[str, str], q: float) -> float | None:
+        latencies = self._latencies.get(key)
+        if not latencies or len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def hedge_delay(self, key: tuple[str, str]) -> float | None:
+        """How long to wait before hedging a call, or None to not hedge"""
+        if not LLM_HEDGING:
+            return None
+        p = self.quantile(key, HEDGE_QUANTILE)
+        return None if p is None else max(HEDGE_MIN_DELAY_SECONDS, p)
+
+
+_tracker = LatencyTracker()
+
+
+def get_latency_tracker() -> LatencyTracker:
+    return _tracker
+
+
+async def hedged(
+    request: Callable[[], Awaitable[T]],
+    delay: float | None,
+    on_hedge: Callable[[], None] | None = None,
+    duplicate: Callable[[], Awaitable[T]] | None = None,
+) -> T:
+    """
+    Run request; if it has not finished after `delay` seconds, start a
+    duplicate (`duplicate` if given, else request again) and return whichever
+    succeeds first. The loser is cancelled and awaited so its rate-limiter
+    slot and buffers are released. A failure only propagates once both copies
+    have failed.
+    """
+    if delay is None:
+        return await request()
+
+    pending = {asyncio.ensure_future(request())}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return done.pop().result()
+
+        if on_hedge:
+            on_hedge()
+        pending.add(asyncio.ensure_future((duplicate or request)()))
+
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
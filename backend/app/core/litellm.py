@@ -1,9 +1,20 @@
+import asyncio
 import base64
+import io
 import os
+import time
 from enum import Enum
+from typing import BinaryIO
 
-from litellm import acompletion, aembedding
-from litellm.types.utils import EmbeddingResponse, ModelResponse
+from litellm.types.utils import ModelResponse
+
+from app.core.deadlines import call_timeout
+from app.core.embedding_batcher import get_embedding_batcher
+from app.core.embedding_cache import get_embedding_cache
+from app.core.hedging import get_latency_tracker
+from app.core.llm_metrics import record_llm_call
+from app.core.llm_provider import get_llm_provider
+from app.core.rate_limiter import estimate_tokens, get_rate_limiter
 
 
 class ModelType(Enum):
@@ -27,6 +38,37 @@ class EmbeddingModelType(Enum):
     # MODERNBERT_EMBED_BASE = "modernbert-embed-base" # 768 dimensions
 
 
+# Multiple of 3 so chunk encodings concatenate into one valid base64 string
+_BASE64_CHUNK_SIZE = 3 * 256 * 1024
+
+
+def _pdf_data_url(pdf: bytes | BinaryIO) -> str:
+    """
+    Base64-encode a PDF into a data URL chunk by chunk, without first reading
+    the whole input into memory. The encoded buffer and the returned str are
+    both alive while decoding, so the peak is ~2x the encoded size (~2.7x the
+    PDF); extraction_footprint() charges this against the byte budget.
+    """
+    stream = io.BytesIO(pdf) if isinstance(pdf, bytes) else pdf
+    stream.seek(0)
+
+    encoded = bytearray(b"data:application/pdf;base64,")
+    while chunk := stream.read(_BASE64_CHUNK_SIZE):
+        encoded += base64.b64encode(chunk)
+
+    return encoded.decode("ascii")
+
+
+# Gemini bills ~258 tokens per PDF page; ~200 bytes per token is a rough
+# average for the documents we process and is corrected from response.usage
+_PDF_BYTES_PER_TOKEN = 200
+
+
+def _total_tokens(response) -> int | None:
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
 class LLMClient:
     """Simplified LLM client for agentic workflows."""
 
@@ -59,14 +101,18 @@ class LLMClient:
         self,
         input_text: str | list[str],
         model: EmbeddingModelType | None = None,
+        stage: str = "embedding",
     ) -> list[float] | list[list[float]]:
         """
         Generate embeddings for text.
         ALWAYS returns 1536-dimensional vectors regardless of model.
+        Cached embeddings (in-process LRU, then the embedding_cache table) are
+        reused; only misses are embedded, micro-batched with concurrent calls.
 
         Args:
             input_text: Single string or list of strings to embed
             model: Override default embedding model
+            stage: Pipeline stage the call is attributed to in LLM metrics
 
         Returns:
             Single 1536-dim vector or list of 1536-dim vectors
@@ -77,13 +123,38 @@ class LLMClient:
         # Ensure input is a list
         inputs = [input_text] if isinstance(input_text, str) else input_text
 
-        # Generate embeddings with fixed dimensions
-        response: EmbeddingResponse = await aembedding(
-            model=embed_model, input=inputs, dimensions=768
-        )
+        started = time.perf_counter()
+        cache = get_embedding_cache()
+        cached = await cache.get_many(embed_model, 768, inputs)
+        misses = [text for text in dict.fromkeys(inputs) if text not in cached]
 
-        # Extract embeddings
-        embeddings = [data.embedding for data in response.data]
+        # Concurrent callers share micro-batched requests with fixed dimensions
+        error = None
+        try:
+            if misses:
+                batcher = get_embedding_batcher(embed_model, 768)
+                async with asyncio.timeout(call_timeout(stage)):
+                    generated = await batcher.embed(misses)
+                new_embeddings = dict(zip(misses, generated, strict=True))
+                await cache.put_many(embed_model, 768, new_embeddings)
+                cached.update(new_embeddings)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # Embedding retries happen per shared batch (see /metrics/rate_limits)
+            record_llm_call(
+                "embedding",
+                embed_model,
+                stage,
+                prompt_tokens=sum(estimate_tokens(text) for text in misses),
+                completion_tokens=0,
+                latency_seconds=time.perf_counter() - started,
+                cache_hits=len(inputs) - len(misses),
+                error=error,
+            )
+
+        embeddings = [cached[text] for text in inputs]
 
         # Return single embedding if single input
         return embeddings[0] if isinstance(input_text, str) else embeddings
@@ -91,23 +162,36 @@ class LLMClient:
     async def chat(
         self,
         content: str,
-        pdf_bytes: bytes | None = None,
+        pdf_bytes: bytes | BinaryIO | None = None,
         max_tokens: int | None = None,
         json_response: bool = False,
+        model: ModelType | None = None,
+        stage: str = "chat",
     ) -> ModelResponse:
         """
         Send a completion request.
 
+        Safe to call concurrently on a shared client: pass `model` to
+        override the default per call instead of mutating it with set_model.
+        Requests go through the model's shared rate limiter, which throttles
+        to the provider quota and retries 429/5xx responses with backoff.
+        The call is bounded by the stage timeout and the current deadline
+        (raising TimeoutError) and, with LLM_HEDGING, duplicated once it runs
+        past the p95 latency for its model and stage.
+
         Args:
             content: Text prompt/question
-            pdf_bytes: Optional PDF file bytes
+            pdf_bytes: Optional PDF as bytes or a seekable binary file
             max_tokens: Max tokens to generate
             json_response: Force JSON output format
+            model: Override default completion model
+            stage: Pipeline stage the call is attributed to in LLM metrics
 
         Returns:
             ModelResponse with completion
         """
         messages = []
+        estimated_tokens = estimate_tokens(content) + (max_tokens or 0)
 
         # Add system prompt if set
         if self.system_prompt:
@@ -115,9 +199,9 @@ class LLMClient:
 
         # Build user message
         if pdf_bytes:
-            # Encode PDF as base64
-            encoded = base64.b64encode(pdf_bytes).decode("utf-8")
-            base64_pdf = f"data:application/pdf;base64,{encoded}"
+            # Encode PDF as a base64 data URL
+            base64_pdf = _pdf_data_url(pdf_bytes)
+            estimated_tokens += len(base64_pdf) * 3 // 4 // _PDF_BYTES_PER_TOKEN
 
             messages.append(
                 {
@@ -131,9 +215,63 @@ class LLMClient:
         else:
             messages.append({"role": "user", "content": content})
 
-        return await acompletion(
-            model=self.model.value,
-            messages=messages,
-            max_tokens=max_tokens,
-            response_format={"type": "json_object"} if json_response else None,
-        )
+        if self.system_prompt:
+            estimated_tokens += estimate_tokens(self.system_prompt)
+
+        model_name = model.value if model else self.model.value
+        limiter = get_rate_limiter(model_name)
+        tracker = get_latency_tracker()
+        attempts, hedges = 0, 0
+
+        async def request() -> ModelResponse:
+            nonlocal attempts
+            attempts += 1
+            return await get_llm_provider().acompletion(
+                model=model_name,
+                messages=messages,
+                max_tokens=max_tokens,
+                response_format={"type": "json_object"} if json_response else None,
+                timeout=timeout,
+            )
+
+        def on_hedge() -> None:
+            nonlocal hedges
+            hedges += 1
+            print(f"Hedging slow {stage} request to {model_name}", flush=True)
+
+        started = time.perf_counter()
+        response, error = None, None
+        try:
+            # Bounded by the stage timeout and any enclosing deadline (e.g. the
+            # queue item's), covering rate-limiter waits, retries and hedges
+            timeout = call_timeout(stage)
+            async with asyncio.timeout(timeout):
+                response = await limiter.call(
+                    request,
+                    estimated_tokens=estimated_tokens,
+                    actual_tokens=_total_tokens,
+                    # The hedge timer starts once a slot is held, and only
+                    # provider latency feeds the quantile
+                    hedge_delay=tracker.hedge_delay((model_name, stage)),
+                    on_hedge=on_hedge,
+                    on_latency=lambda seconds: tracker.observe(
+                        (model_name, stage), seconds
+                    ),
+                )
+            return response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            usage = getattr(response, "usage", None)
+            record_llm_call(
+                "completion",
+                model_name,
+                stage,
+                prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+                completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+                latency_seconds=time.perf_counter() - started,
+                retries=max(0, attempts - 1 - hedges),
+                hedges=hedges,
+                error=error,
+            )
@@ -0,0 +1,183 @@
+import json
+import os
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from uuid import UUID
+
+import litellm
+
+# USD per 1M (prompt, completion) tokens for models missing from litellm's
+# price map; override or extend with LLM_PRICES='{"<model>": [in, out]}'
+DEFAULT_PRICES = {
+    "gemini/gemini-3-pro-preview": (2.00, 12.00),
+    "gemini/text-embedding-004": (0.0, 0.0),
+}
+LATENCY_BUCKETS_SECONDS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_prices = {
+    **DEFAULT_PRICES,
+    **{k: tuple(v) for k, v in json.loads(os.getenv("LLM_PRICES", "{}")).items()},
+}
+_unpriced: set[str] = set()
+
+
+@dataclass
+class LlmUsage:
+    """Running totals for a set of LLM calls"""
+
+    calls: int = 0
+    errors: int = 0
+    retries: int = 0
+    hedges: int = 0
+    cache_hits: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    latency_seconds: float = 0.0
+    by_stage: dict[str, dict] = field(default_factory=dict)
+
+    def add(self, record: dict) -> None:
+        self.calls += 1
+        self.errors += record["error"] is not None
+        self.retries += record["retries"]
+        self.hedges += record["hedges"]
+        self.cache_hits += record["cache_hits"]
+        self.prompt_tokens += record["prompt_tokens"]
+        self.completion_tokens += record["completion_tokens"]
+        self.cost_usd += record["cost_usd"]
+        self.latency_seconds += record["latency_seconds"]
+
+        stage = self.by_stage.setdefault(
+            record["stage"], {"calls": 0, "tokens": 0, "cost_usd": 0.0}
+        )
+        stage["calls"] += 1
+        stage["tokens"] += record["prompt_tokens"] + record["completion_tokens"]
+        stage["cost_usd"] += record["cost_usd"]
+
+
+@dataclass
+class LatencyHistogram:
+    """Cumulative latency histogram over LATENCY_BUCKETS_SECONDS"""
+
+    counts: list[int] = field(
+        default_factory=lambda: [0] * (len(LATENCY_BUCKETS_SECONDS) + 1)
+    )
+    count: int = 0
+    sum: float = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS_SECONDS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def buckets(self) -> dict[str, int]:
+        cumulative, total = {}, 0
+        for bound, n in zip(
+            [*map(str, LATENCY_BUCKETS_SECONDS), "+Inf"], self.counts, strict=True
+        ):
+            total += n
+            cumulative[bound] = total
+        return cumulative
+
+
+_tenant_id: ContextVar[str | None] = ContextVar("llm_tenant_id", default=None)
+_usage: ContextVar[LlmUsage | None] = ContextVar("llm_usage", default=None)
+
+# Aggregates for this process, keyed by (tenant, stage, model) and (stage, model)
+_counters: dict[tuple[str | None, str, str], LlmUsage] = {}
+_histograms: dict[tuple[str, str], LatencyHistogram] = {}
+
+
+def bind_llm_context(
+    tenant_id: UUID | str | None, track_usage: bool = False
+) -> LlmUsage | None:
+    """
+    Attribute subsequent LLM calls in this task (and tasks it spawns) to a
+    tenant. With track_usage, also start a fresh LlmUsage that accumulates
+    every such call (e.g. all shards and the embedding of one document).
+    """
+    _tenant_id.set(str(tenant_id) if tenant_id else None)
+    usage = LlmUsage() if track_usage else None
+    _usage.set(usage)
+    return usage
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    if model in _prices:
+        prompt_price, completion_price = _prices[model]
+        return (
+            prompt_tokens * prompt_price + completion_tokens * completion_price
+        ) / 1e6
+    if model in _unpriced:
+        return 0.0
+    try:
+        prompt_cost, completion_cost = litellm.cost_per_token(
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+        )
+        return prompt_cost + completion_cost
+    except Exception:
+        _unpriced.add(model)
+        return 0.0
+
+
+def record_llm_call(
+    kind: str,
+    model: str,
+    stage: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    latency_seconds: float,
+    retries: int = 0,
+    hedges: int = 0,
+    cache_hits: int = 0,
+    error: Exception | None = None,
+) -> None:
+    """Log one structured call record and fold it into the aggregates"""
+    tenant_id = _tenant_id.get()
+    record = {
+        "kind": kind,
+        "model": model,
+        "stage": stage,
+        "tenant_id": tenant_id,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "latency_seconds": round(latency_seconds, 4),
+        "retries": retries,
+        "hedges": hedges,
+        "cache_hits": cache_hits,
+        "cost_usd": estimate_cost(model, prompt_tokens, completion_tokens),
+        "error": type(error).__name__ if error else None,
+    }
+    print(f"llm_call {json.dumps(record)}", flush=True)
+
+    _counters.setdefault((tenant_id, stage, model), LlmUsage()).add(record)
+    _histograms.setdefault((stage, model), LatencyHistogram()).observe(latency_seconds)
+    usage = _usage.get()
+    if usage is not None:
+        usage.add(record)
+
+
+def get_llm_metrics(tenant_id: UUID | None = None) -> dict:
+    """Per-tenant counters and per-stage latency histograms for this process"""
+    counters = [
+        {"tenant_id": tenant, "stage": stage, "model": model, **asdict(usage)}
+        for (tenant, stage, model), usage in _counters.items()
+        if tenant_id is None or tenant == str(tenant_id)
+    ]
+    for counter in counters:
+        del counter["by_stage"]
+
+    histograms = [
+        {
+            "stage": stage,
+            "model": model,
+            "count": histogram.count,
+            "sum_seconds": histogram.sum,
+            "buckets": histogram.buckets(),
+        }
+        for (stage, model), histogram in _histograms.items()
+    ]
+    return {"counters": counters, "latency": histograms}
@@ -0,0 +1,261 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+from pathlib import Path
+
+import litellm
+import numpy as np
+from litellm.types.utils import Embedding, EmbeddingResponse, ModelResponse, Usage
+
+# litellm (default) | fake | record | replay
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "litellm")
+LLM_FIXTURES_DIR = Path(os.getenv("LLM_FIXTURES_DIR", "fixtures/llm"))
+
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", 0))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", 0))
+FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED", 0))
+# Optional JSON file of [{"contains": "...", "content": "..."}] canned replies
+FAKE_LLM_RESPONSES = os.getenv("FAKE_LLM_RESPONSES")
+
+_MANUFACTURERS = ["Kawasaki", "FANUC", "ABB", "KUKA", "Yaskawa", "Denso"]
+_DOCUMENT_TYPES = ["Robot Arm Spec Sheet", "Controller Manual", "Gripper Datasheet"]
+
+
+def _digest(value: str) -> bytes:
+    return hashlib.sha256(value.encode("utf-8")).digest()
+
+
+def _prompt_text(messages: list[dict]) -> str:
+    """Text of the last user message (ignoring any attached PDF)"""
+    content = messages[-1]["content"]
+    if isinstance(content, list):
+        return "\n".join(part["text"] for part in content if part["type"] == "text")
+    return content
+
+
+class LiteLLMProvider:
+    """Live provider: forwards requests to litellm"""
+
+    async def acompletion(self, **kwargs) -> ModelResponse:
+        return await litellm.acompletion(**kwargs)
+
+    async def aembedding(self, **kwargs) -> EmbeddingResponse:
+        return await litellm.aembedding(**kwargs)
+
+
+class FakeProvider:
+    """
+    Offline provider for benchmarking. Embeddings are unit vectors seeded by a
+    hash of the text, so identical texts always embed identically. Completions
+    are canned but deterministic in the prompt: structured extraction JSON,
+    cluster names, and relationship lists for the prompts this backend sends.
+    Latency and 429/503 errors are injected from a seeded RNG.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = FAKE_LLM_LATENCY_MS,
+        error_rate: float = FAKE_LLM_ERROR_RATE,
+        seed: int = FAKE_LLM_SEED,
+        responses_path: str | None = FAKE_LLM_RESPONSES,
+    ):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._responses = (
+            json.loads(Path(responses_path).read_text()) if responses_path else []
+        )
+
+    async def acompletion(self, **kwargs) -> ModelResponse:
+        await self._simulate(kwargs["model"])
+        prompt = _prompt_text(kwargs["messages"])
+        json_response = kwargs.get("response_format") is not None
+        content = self._reply(prompt, json_response)
+        prompt_tokens = len(prompt) // 4 + 1
+        completion_tokens = len(content) // 4 + 1
+
+        return ModelResponse(
+            model=kwargs["model"],
+            choices=[
+                {
+                    "message": {"content": content, "role": "assistant"},
+                    "finish_reason": "stop",
+                }
+            ],
+            usage=Usage(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            ),
+        )
+
+    async def aembedding(self, **kwargs) -> EmbeddingResponse:
+        await self._simulate(kwargs["model"])
+        dimensions = kwargs.get("dimensions") or 768
+        return EmbeddingResponse(
+            model=kwargs["model"],
+            data=[
+                Embedding(
+                    embedding=self.embedding(text, dimensions),
+                    index=i,
+                    object="embedding",
+                )
+                for i, text in enumerate(kwargs["input"])
+            ],
+        )
+
+    @staticmethod
+    def embedding(text: str, dimensions: int) -> list[float]:
+        seed = int.from_bytes(_digest(text)[:8], "big")
+        vector = np.random.default_rng(seed).standard_normal(dimensions)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    async def _simulate(self, model: str) -> None:
+        if self.latency_ms:
+            jitter = self._rng.uniform(0.5, 1.5)
+            await asyncio.sleep(self.latency_ms * jitter / 1000)
+        if self.error_rate and self._rng.random() < self.error_rate:
+            if self._rng.random() < 0.5:
+                raise litellm.RateLimitError("Injected 429", "fake", model)
+            raise litellm.ServiceUnavailableError("Injected 503", "fake", model)
+
+    def _reply(self, prompt: str, json_response: bool) -> str:
+        for canned in self._responses:
+            if canned["contains"] in prompt:
+                content = canned["content"]
+                return content if isinstance(content, str) else json.dumps(content)
+
+        digest = _digest(prompt)
+
+        # Relationship discovery (pattern recognition)
+        entities = re.search(r"ENTITIES: (.*)", prompt)
+        if entities:
+            names = [n.strip() for n in entities.group(1).split(",") if n.strip()]
+            return json.dumps(
+                [
+                    {"from_type": a, "to_type": b, "relationship_type": "one-to-many"}
+                    for a, b in zip(names, names[1:], strict=False)
+                ]
+            )
+
+        # Single-call cluster naming
+        clusters = re.findall(r"^Cluster (\d+):", prompt, re.MULTILINE)
+        if clusters and json_response:
+            return json.dumps(
+                {
+                    cluster_id: _DOCUMENT_TYPES[
+                        _digest(prompt + cluster_id)[0] % len(_DOCUMENT_TYPES)
+                    ]
+                    for cluster_id in clusters
+                }
+            )
+
+        # Cluster naming
+        if "classification name" in prompt:
+            return _DOCUMENT_TYPES[digest[0] % len(_DOCUMENT_TYPES)]
+
+        if not json_response:
+            return "OK"
+
+        # Structured PDF extraction
+        return json.dumps(
+            {
+                "manufacturer": _MANUFACTURERS[digest[0] % len(_MANUFACTURERS)],
+                "model": f"RS{digest[1]:03d}N",
+                "document_id": digest[:4].hex().upper(),
+                "payload_kg": 5 + digest[2] % 80,
+                "reach_mm": 500 + 10 * digest[3],
+                "repeatability_mm": f"±{(digest[4] % 10 + 1) / 100}",
+                "axes": [
+                    {"axis": f"JT{i + 1}", "range": f"±{90 + digest[5 + i] % 270}"}
+                    for i in range(6)
+                ],
+            }
+        )
+
+
+class RecordReplayProvider:
+    """
+    Fixture-backed provider. In record mode each live litellm response is saved
+    under LLM_FIXTURES_DIR keyed by a hash of the request; in replay mode
+    responses are served from those fixtures and a missing one is an error.
+    Embeddings are stored per input text, since EmbeddingBatcher groups
+    inputs differently from run to run.
+    """
+
+    def __init__(self, record: bool, fixtures_dir: Path = LLM_FIXTURES_DIR):
+        self.record = record
+        self.fixtures_dir = fixtures_dir
+        self._live = LiteLLMProvider()
+        if record:
+            fixtures_dir.mkdir(parents=True, exist_ok=True)
+
+    async def acompletion(self, **kwargs) -> ModelResponse:
+        data = await self._fetch("completion", kwargs, self._live.acompletion)
+        return ModelResponse(**data)
+
+    async def aembedding(self, **kwargs) -> EmbeddingResponse:
+        paths = [
+            self._fixture_path("embedding", {**kwargs, "input": text})
+            for text in kwargs["input"]
+        ]
+
+        if self.record:
+            response = await self._live.aembedding(**kwargs)
+            vectors = [item["embedding"] for item in response.model_dump()["data"]]
+            for path, vector in zip(paths, vectors, strict=True):
+                path.write_text(json.dumps({"embedding": vector}))
+        else:
+            missing = next((path for path in paths if not path.exists()), None)
+            if missing is not None:
+                raise FileNotFoundError(f"No recorded embedding fixture at {missing}")
+            vectors = [json.loads(path.read_text())["embedding"] for path in paths]
+
+        return EmbeddingResponse(
+            model=kwargs["model"],
+            data=[
+                Embedding(embedding=vector, index=i, object="embedding")
+                for i, vector in enumerate(vectors)
+            ],
+        )
+
+    def _fixture_path(self, kind: str, kwargs: dict) -> Path:
+        # The timeout shrinks with the caller's deadline; it isn't part of the key
+        key = {k: v for k, v in kwargs.items() if k != "timeout"}
+        request = json.dumps({"kind": kind, **key}, sort_keys=True, default=str)
+        return self.fixtures_dir / f"{kind}-{_digest(request).hex()[:32]}.json"
+
+    async def _fetch(self, kind: str, kwargs: dict, live) -> dict:
+        path = self._fixture_path(kind, kwargs)
+
+        if not self.record:
+            if not path.exists():
+                raise FileNotFoundError(f"No recorded {kind} fixture at {path}")
+            return json.loads(path.read_text())
+
+        response = await live(**kwargs)
+        data = response.model_dump()
+        path.write_text(json.dumps(data))
+        return data
+
+
+_provider: LiteLLMProvider | FakeProvider | RecordReplayProvider | None = None
+
+
+def get_llm_provider() -> LiteLLMProvider | FakeProvider | RecordReplayProvider:
+    """Process-wide provider selected by LLM_PROVIDER"""
+    global _provider
+    if _provider is None:
+        if LLM_PROVIDER == "fake":
+            _provider = FakeProvider()
+        elif LLM_PROVIDER in ("record", "replay"):
+            _provider = RecordReplayProvider(record=LLM_PROVIDER == "record")
+        elif LLM_PROVIDER == "litellm":
+            _provider = LiteLLMProvider()
+        else:
+            raise ValueError(f"Unknown LLM_PROVIDER: {LLM_PROVIDER}")
+        print(f"LLM provider: {LLM_PROVIDER}", flush=True)
+    return _provider
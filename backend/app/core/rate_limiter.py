@@ -0,0 +1,241 @@
+import asyncio
+import json
+import os
+import random
+import time
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+import litellm
+
+from app.core.hedging import hedged
+
+T = TypeVar("T")
+
+# Per-model quotas; override with LLM_RATE_LIMITS='{"<model>": {"rpm": ..., ...}}'
+DEFAULT_LIMITS = {
+    "default": {"rpm": 500, "tpm": 1_000_000, "max_concurrency": 16},
+    "gemini/gemini-2.5-flash": {"rpm": 1000, "tpm": 1_000_000, "max_concurrency": 32},
+    "gemini/gemini-3-pro-preview": {"rpm": 150, "tpm": 1_000_000, "max_concurrency": 8},
+    "gemini/text-embedding-004": {"rpm": 1500, "tpm": 1_000_000, "max_concurrency": 16},
+}
+
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 5))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+# At most one multiplicative decrease per cooldown, so a burst of 429s/503s from
+# requests that were already in flight counts as a single congestion signal
+DECREASE_COOLDOWN_SECONDS = 5.0
+
+
+def _load_limits() -> dict[str, dict]:
+    limits = {model: dict(config) for model, config in DEFAULT_LIMITS.items()}
+    overrides = os.getenv("LLM_RATE_LIMITS")
+    if overrides:
+        for model, config in json.loads(overrides).items():
+            limits.setdefault(model, dict(limits["default"])).update(config)
+    return limits
+
+
+def _is_throttle(e: Exception) -> bool:
+    """Congestion signals that cut the concurrency limit: 429 and 503"""
+    if isinstance(e, litellm.RateLimitError | litellm.ServiceUnavailableError):
+        return True
+    return getattr(e, "status_code", None) in (429, 503)
+
+
+def _is_retryable(e: Exception) -> bool:
+    if isinstance(
+        e,
+        litellm.RateLimitError
+        | litellm.InternalServerError
+        | litellm.ServiceUnavailableError
+        | litellm.APIConnectionError
+        | litellm.Timeout,
+    ):
+        return True
+    status_code = getattr(e, "status_code", None)
+    return isinstance(status_code, int) and status_code >= 500
+
+
+class TokenBucket:
+    """Refills `per_minute` units evenly over a minute; waiters are served FIFO"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    async def acquire(self, amount: float) -> None:
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+    def adjust(self, amount: float) -> None:
+        """Charge (or refund) the difference between estimated and actual usage"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class ModelRateLimiter:
+    """
+    Shared limiter for one model: request and token buckets sized to the
+    provider quota, plus an AIMD concurrency limit. Every success raises the
+    limit by ~1 per window of requests; a 429 or 503 halves it (once per
+    cooldown).
+    Retryable failures (429, 5xx, timeouts, connection errors) are retried with
+    full-jitter exponential backoff. Hedging happens inside an acquired slot,
+    and not at all while the concurrency limit is backed off.
+    """
+
+    def __init__(self, model: str, rpm: int, tpm: int, max_concurrency: int):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.in_flight = 0
+        self.throttled = 0
+        self.retries = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def call(
+        self,
+        request: Callable[[], Awaitable[T]],
+        estimated_tokens: int = 0,
+        actual_tokens: Callable[[T], int | None] | None = None,
+        hedge_delay: float | None = None,
+        on_hedge: Callable[[], None] | None = None,
+        on_latency: Callable[[float], None] | None = None,
+    ) -> T:
+        """
+        Run request under the limiter, retrying retryable failures.
+        Once it holds a slot and quota, an attempt still running after
+        hedge_delay seconds is hedged with a duplicate that takes its own
+        slot and quota. on_latency receives each successful attempt's
+        provider latency (excluding limiter waits)
+        """
+
+        async def duplicate() -> T:
+            await self._acquire_slot()
+            try:
+                await self.requests.acquire(1)
+                await self.tokens.acquire(estimated_tokens)
+                return await request()
+            finally:
+                await self._release_slot()
+
+        for attempt in range(MAX_RETRIES + 1):
+            await self._acquire_slot()
+            try:
+                await self.requests.acquire(1)
+                await self.tokens.acquire(estimated_tokens)
+                started = time.perf_counter()
+                # Duplicates add load: never while the provider is throttling
+                result = await hedged(
+                    request,
+                    None if self._backed_off() else hedge_delay,
+                    on_hedge,
+                    duplicate,
+                )
+                if on_latency:
+                    on_latency(time.perf_counter() - started)
+            except Exception as e:
+                if not _is_retryable(e) or attempt == MAX_RETRIES:
+                    raise
+                self._on_failure(e)
+            else:
+                self._on_success()
+                used = actual_tokens(result) if actual_tokens else None
+                if used is not None:
+                    self.tokens.adjust(used - estimated_tokens)
+                return result
+            finally:
+                await self._release_slot()
+
+            self.retries += 1
+            delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt)
+            await asyncio.sleep(random.uniform(0, delay))
+
+        raise RuntimeError("unreachable")
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": self.concurrency_limit,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "throttled": self.throttled,
+            "retries": self.retries,
+        }
+
+    def _backed_off(self) -> bool:
+        return self.concurrency_limit < self.max_concurrency
+
+    async def _acquire_slot(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: self.in_flight < max(1, int(self.concurrency_limit))
+            )
+            self.in_flight += 1
+
+    async def _release_slot(self) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def _on_success(self) -> None:
+        self.concurrency_limit = min(
+            float(self.max_concurrency),
+            self.concurrency_limit + 1.0 / self.concurrency_limit,
+        )
+
+    def _on_failure(self, e: Exception) -> None:
+        if not _is_throttle(e):
+            return
+        self.throttled += 1
+        now = time.monotonic()
+        if now - self._last_decrease >= DECREASE_COOLDOWN_SECONDS:
+            self._last_decrease = now
+            self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+            print(
+                f"Throttled by {self.model} ({type(e).__name__}); concurrency -> "
+                f"{int(self.concurrency_limit)}",
+                flush=True,
+            )
+
+
+_limits = _load_limits()
+_limiters: dict[str, ModelRateLimiter] = {}
+
+
+def get_rate_limiter(model: str) -> ModelRateLimiter:
+    """Process-wide limiter shared by every caller of the given model"""
+    if model not in _limiters:
+        config = _limits.get(model, _limits["default"])
+        _limiters[model] = ModelRateLimiter(
+            model, config["rpm"], config["tpm"], config["max_concurrency"]
+        )
+    return _limiters[model]
+
+
+def get_rate_limiter_stats() -> dict[str, dict]:
+    return {model: limiter.stats() for model, limiter in _limiters.items()}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token)"""
+    return len(text) // 4 + 1
@@ -5,10 +5,12 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.api import api_router
+from app.core.compute_pool import shutdown_compute_pool
+from app.core.embedding_cache import configure_embedding_cache
 from app.core.seed_data import seed_database
 from app.core.supabase import get_async_supabase
 from app.core.webhooks import configure_webhooks
-from app.utils.preprocess.preprocessing_queue import init_queue
+from app.utils.preprocess.preprocessing_queue import init_queue, shutdown_queue
 from app.utils.supabase_check import wait_for_supabase
 
 
@@ -22,13 +24,18 @@ async def lifespan(app: FastAPI):
 
     await configure_webhooks(supabase)
 
+    configure_embedding_cache(supabase)
+
+    # Resumes any extractions left queued or orphaned by a previous process
     await init_queue(supabase)
 
     if os.getenv("ENVIRONMENT") == "development":
         await seed_database(supabase)
 
     yield
-    # Shutdown (if needed)
+    # Shutdown
+    await shutdown_queue()
+    shutdown_compute_pool()
 
 
 app = FastAPI(title="Cortex ETL API", lifespan=lifespan)
@@ -1,10 +1,13 @@
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 
+from app.core.compute_pool import run_until_disconnected
 from app.core.dependencies import get_current_admin
+from app.core.llm_metrics import bind_llm_context
 from app.schemas.classification_schemas import (
     Classification,
+    ClassificationAssignmentResponse,
     ExtractedFile,
     VisualizationResponse,
 )
@@ -30,6 +33,7 @@ router = APIRouter(prefix="/classification", tags=["Classification"])
 @router.get("/visualize_clustering/{tenant_id}", response_model=VisualizationResponse)
 async def visualize_clustering(
     tenant_id: UUID,
+    request: Request,
     classification_service: ClassificationService = Depends(get_classification_service),
     admin=Depends(get_current_admin),
 ):
@@ -52,7 +56,10 @@ async def visualize_clustering(
         if len(extracted_files) < 2:
             return await create_empty_visualization(dataset)
 
-        visualizationResponse = await reduce_to_visualization(dataset)
+        # UMAP runs in the compute pool and is cancelled if the client leaves
+        visualizationResponse = await run_until_disconnected(
+            request, reduce_to_visualization(dataset)
+        )
 
         return visualizationResponse
 
@@ -63,12 +70,14 @@ async def visualize_clustering(
 @router.post("/create_classifications/{tenant_id}", response_model=list[Classification])
 async def create_classifications(
     tenant_id: UUID,
+    request: Request,
     classification_service: ClassificationService = Depends(get_classification_service),
     admin=Depends(get_current_admin),
 ) -> list[Classification]:
     """
     Analyze all extracted files and create or update classifications
     """
+    bind_llm_context(tenant_id)
     try:
         extracted_files: list[
             ExtractedFile
@@ -90,11 +99,32 @@ async def create_classifications(
                 status_code=404, detail="Unable to get initial classifications"
             )
 
-        classification_names: list[str] = await create_classifications_helper(
-            extracted_files,
-            [classification.name for classification in initial_classifications],
+        previous_state = await classification_service.get_clustering_state(tenant_id)
+        cluster_name_cache = await classification_service.get_cluster_names(tenant_id)
+
+        (
+            classification_names,
+            clustering_state,
+            cluster_names,
+        ) = await run_until_disconnected(
+            request,
+            create_classifications_helper(
+                extracted_files,
+                [classification.name for classification in initial_classifications],
+                previous_state,
+                cluster_name_cache,
+            ),
         )
 
+        # Unchanged document sets reuse the stored model as-is
+        if clustering_state is not None:
+            await classification_service.save_clustering_state(
+                tenant_id, clustering_state
+            )
+
+        if cluster_names is not None:
+            await classification_service.set_cluster_names(tenant_id, cluster_names)
+
         if classification_names is None:
             raise HTTPException(
                 status_code=500, detail="Unable to create classifications"
@@ -126,6 +156,7 @@ async def classify_files(
     """
     Analyze all extracted files and create or update classifications
     """
+    bind_llm_context(tenant_id)
     try:
         extracted_files: list[
             ExtractedFile
@@ -143,6 +174,11 @@ async def classify_files(
         if classifications is None or len(classifications) == 0:
             raise HTTPException(status_code=404, detail="Unable to get classifications")
 
+        # Stored embeddings are reused; only legacy rows are embedded (once)
+        classifications = await classification_service.ensure_classification_embeddings(
+            classifications
+        )
+
         classified_extracted_files: list[ExtractedFile] = await classify_files_helper(
             extracted_files, classifications
         )
@@ -152,14 +188,56 @@ async def classify_files(
                 status_code=404, detail="Failed to classify extracted files"
             )
 
-        for classified_extracted_file in classified_extracted_files:
-            if classified_extracted_file.classification:
-                await classification_service.classify_file(
-                    classified_extracted_file.file_upload_id,
-                    classified_extracted_file.classification.classification_id,
-                )
+        # One bulk write instead of a request per file
+        await classification_service.classify_files_bulk(
+            tenant_id,
+            {
+                file.file_upload_id: file.classification.classification_id
+                for file in classified_extracted_files
+                if file.classification
+            },
+        )
 
         return classified_extracted_files
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+@router.post(
+    "/assign_classifications/{tenant_id}",
+    response_model=ClassificationAssignmentResponse,
+)
+async def assign_classifications(
+    tenant_id: UUID,
+    reclassify: bool = False,
+    classification_service: ClassificationService = Depends(get_classification_service),
+    admin=Depends(get_current_admin),
+) -> ClassificationAssignmentResponse:
+    """
+    Assign files to their nearest classification inside Postgres (pgvector),
+    without loading file embeddings into the backend. Only unclassified files
+    are assigned unless reclassify is set
+    """
+    bind_llm_context(tenant_id)
+    try:
+        classifications: list[
+            Classification
+        ] = await classification_service.get_classifications(tenant_id)
+
+        if not classifications:
+            raise HTTPException(status_code=404, detail="Unable to get classifications")
+
+        # The SQL function matches against stored classification embeddings
+        await classification_service.ensure_classification_embeddings(classifications)
+
+        assigned = await classification_service.assign_nearest_classifications(
+            tenant_id, only_unclassified=not reclassify
+        )
+
+        return ClassificationAssignmentResponse(assigned=assigned)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
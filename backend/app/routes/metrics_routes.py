@@ -0,0 +1,43 @@
+from uuid import UUID
+
+from fastapi import APIRouter, Depends
+
+from app.core.dependencies import get_current_admin
+from app.core.embedding_cache import get_embedding_cache
+from app.core.llm_metrics import get_llm_metrics
+from app.core.rate_limiter import get_rate_limiter_stats
+from app.schemas.metrics_schemas import (
+    EmbeddingCacheStats,
+    LlmMetrics,
+    RateLimiterStats,
+)
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+
+@router.get("/embedding_cache", response_model=EmbeddingCacheStats)
+async def embedding_cache_stats(
+    admin=Depends(get_current_admin),
+) -> EmbeddingCacheStats:
+    """Hit/miss statistics for the embedding cache in this process"""
+    return EmbeddingCacheStats(**get_embedding_cache().stats())
+
+
+@router.get("/rate_limits", response_model=dict[str, RateLimiterStats])
+async def rate_limiter_stats(
+    admin=Depends(get_current_admin),
+) -> dict[str, RateLimiterStats]:
+    """Per-model concurrency limits and 429/retry counters in this process"""
+    return {
+        model: RateLimiterStats(**stats)
+        for model, stats in get_rate_limiter_stats().items()
+    }
+
+
+@router.get("/llm", response_model=LlmMetrics)
+async def llm_metrics(
+    tenant_id: UUID | None = None,
+    admin=Depends(get_current_admin),
+) -> LlmMetrics:
+    """Per-tenant LLM tokens, cost and retries, and per-stage latency histograms"""
+    return LlmMetrics(**get_llm_metrics(tenant_id))
@@ -3,6 +3,7 @@ from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException
 
 from app.core.dependencies import get_current_admin
+from app.core.llm_metrics import bind_llm_context
 from app.schemas.relationship_schemas import RelationshipCreate
 from app.services.pattern_recognition_service import (
     PatternRecognitionService,
@@ -30,6 +31,7 @@ async def analyze_relationships(
     4. Stores relationships in the database
     5. Returns the found relationships
     """
+    bind_llm_context(tenant_id)
     try:
         extracted_files = await pattern_service.get_extracted_files(tenant_id)
 
@@ -3,7 +3,10 @@ from uuid import UUID
 from fastapi import APIRouter, Depends
 
 from app.core.dependencies import get_current_admin
-from app.schemas.preprocess_schemas import PreprocessSuccessResponse
+from app.schemas.preprocess_schemas import (
+    ExtractionPriority,
+    PreprocessSuccessResponse,
+)
 from app.services.preprocess_service import PreprocessService, get_preprocess_service
 from app.utils.preprocess.preprocessing_queue import PreprocessingQueue, get_queue
 
@@ -24,8 +27,10 @@ async def handle_extract_webhook(
 
     await preprocess_service.delete_previous_extraction(file_upload_id)
 
-    # Enqueue instead of processing
-    extracted_file_id = await preprocessing_queue.enqueue(file_upload_id)
+    # Admin retries jump ahead of bulk webhook ingestion
+    extracted_file_id = await preprocessing_queue.enqueue(
+        file_upload_id, ExtractionPriority.INTERACTIVE
+    )
 
     return PreprocessSuccessResponse(
         status="queued", file_upload_id=file_upload_id, extraction_id=extracted_file_id
@@ -3,7 +3,10 @@ from uuid import UUID
 
 from fastapi import APIRouter, Depends, Header, HTTPException
 
-from app.schemas.preprocess_schemas import PreprocessSuccessResponse
+from app.schemas.preprocess_schemas import (
+    ExtractionPriority,
+    PreprocessSuccessResponse,
+)
 from app.utils.preprocess.preprocessing_queue import PreprocessingQueue, get_queue
 
 router = APIRouter(prefix="/webhooks", tags=["Webhooks"])
@@ -19,7 +22,9 @@ async def handle_extract_webhook(
         raise HTTPException(status_code=401)
 
     # Enqueue instead of processing
-    extracted_file_id = await preprocessing_queue.enqueue(file_upload_id)
+    extracted_file_id = await preprocessing_queue.enqueue(
+        file_upload_id, ExtractionPriority.BULK
+    )
 
     return PreprocessSuccessResponse(
         status="queued", file_upload_id=file_upload_id, extraction_id=extracted_file_id
@@ -12,6 +12,17 @@ class Classification(BaseModel):
     classification_id: UUID
     tenant_id: UUID
     name: str
+    # Stored name embedding (not serialized in API responses)
+    embedding: list[float] | None = Field(default=None, exclude=True)
+    embedding_model: str | None = Field(default=None, exclude=True)
+
+
+class ClusterName(BaseModel):
+    """A named cluster, fingerprinted by a MinHash of its members"""
+
+    signature: list[int]
+    name: str
+    member_count: int
 
 
 class FileType(str, Enum):
@@ -30,6 +41,10 @@ class ExtractedFile(BaseModel):
     extracted_data: dict[str, Any]
     embedding: list[float]
     classification: Classification | None = None
+    # Cosine similarity to the assigned classification, and its lead over the
+    # runner-up (set by classify_files)
+    classification_score: float | None = None
+    classification_margin: float | None = None
 
 
 class EmbeddingDataset(BaseModel):
@@ -82,3 +97,9 @@ class VisualizationResponse(BaseModel):
     plotly_data: list[PlotlyTrace]
     cluster_stats: dict[int, int]
     total_count: int
+
+
+class ClassificationAssignmentResponse(BaseModel):
+    """Result of assigning files to their nearest classification in Postgres"""
+
+    assigned: int
@@ -0,0 +1,55 @@
+from pydantic import BaseModel
+
+
+class EmbeddingCacheStats(BaseModel):
+    """Hit/miss counters for the two-tier embedding cache"""
+
+    memory_entries: int
+    max_memory_entries: int
+    persistent: bool
+    memory_hits: int
+    db_hits: int
+    misses: int
+    hit_rate: float
+
+
+class RateLimiterStats(BaseModel):
+    """Adaptive concurrency state of one model's shared rate limiter"""
+
+    concurrency_limit: float
+    max_concurrency: int
+    in_flight: int
+    throttled: int
+    retries: int
+
+
+class LlmUsageCounter(BaseModel):
+    """LLM call totals for one tenant, pipeline stage and model"""
+
+    tenant_id: str | None
+    stage: str
+    model: str
+    calls: int
+    errors: int
+    retries: int
+    hedges: int
+    cache_hits: int
+    prompt_tokens: int
+    completion_tokens: int
+    cost_usd: float
+    latency_seconds: float
+
+
+class LlmLatencyHistogram(BaseModel):
+    """Cumulative call latency counts per upper bound (seconds)"""
+
+    stage: str
+    model: str
+    count: int
+    sum_seconds: float
+    buckets: dict[str, int]
+
+
+class LlmMetrics(BaseModel):
+    counters: list[LlmUsageCounter]
+    latency: list[LlmLatencyHistogram]
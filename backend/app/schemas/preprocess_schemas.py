@@ -1,8 +1,17 @@
+from enum import IntEnum
 from uuid import UUID
 
 from pydantic import BaseModel, Field
 
 
+class ExtractionPriority(IntEnum):
+    """Queue lanes for extractions; lower values are claimed first"""
+
+    INTERACTIVE = 0  # admin-initiated, e.g. retry_extraction
+    RETRY = 1  # automatic re-attempts of orphaned work
+    BULK = 2  # storage upload webhooks
+
+
 # Response models
 class PreprocessSuccessResponse(BaseModel):
     """Successful webhook processing response"""
@@ -10,3 +19,28 @@ class PreprocessSuccessResponse(BaseModel):
     status: str = Field(default="success")
     file_upload_id: UUID = Field(..., description="file_uploads table UUID")
     extraction_id: UUID = Field(..., description="extracted_files table UUID")
+
+
+class PdfInspection(BaseModel):
+    """Pre-flight report on a PDF before it is sent to the LLM"""
+
+    page_count: int = 0
+    encrypted: bool = False
+    readable: bool = Field(
+        default=True, description="False if the PDF could not be parsed locally"
+    )
+    text_pages: list[int] = Field(
+        default_factory=list, description="0-based pages with a usable text layer"
+    )
+    scanned_pages: list[int] = Field(
+        default_factory=list, description="0-based pages that need vision"
+    )
+    page_texts: list[str] = Field(default_factory=list, exclude=True)
+
+    @property
+    def has_text_layer(self) -> bool:
+        return self.readable and len(self.text_pages) > 0
+
+    @property
+    def is_text_native(self) -> bool:
+        return self.has_text_layer and len(self.scanned_pages) == 0
@@ -1,11 +1,29 @@
+import asyncio
 import json
+import os
+import pickle
 from uuid import UUID
 
 from fastapi import Depends
 from supabase._async.client import AsyncClient
 
+from app.core.litellm import LLMClient
 from app.core.supabase import get_async_supabase
-from app.schemas.classification_schemas import Classification, ExtractedFile
+from app.schemas.classification_schemas import (
+    Classification,
+    ClusterName,
+    ExtractedFile,
+)
+from app.utils.classification.clustering_engine import ClusteringState
+
+# Assignments sent per bulk_classify_files call, bounding the request size
+BULK_CLASSIFY_CHUNK_SIZE = 5000
+
+CLUSTERING_MODELS_BUCKET = "clustering-models"
+# Matches the bucket's file_size_limit; larger models are not persisted
+CLUSTERING_MODEL_MAX_BYTES = int(
+    os.getenv("CLUSTERING_MODEL_MAX_BYTES", 50 * 1024 * 1024)
+)
 
 
 class ClassificationService:
@@ -70,15 +88,77 @@ class ClassificationService:
                 classification_id=row["id"],
                 tenant_id=row["tenant_id"],
                 name=row["name"],
+                embedding=json.loads(row["embedding"])
+                if isinstance(row.get("embedding"), str)
+                else row.get("embedding"),
+                embedding_model=row.get("embedding_model"),
             )
             for row in response.data
         ]
 
+    async def embed_classification_names(
+        self, names: list[str]
+    ) -> tuple[dict[str, list[float]], str]:
+        """
+        Embed classification names in one batched request.
+        Returns name -> embedding and the embedding model used
+        """
+        client = LLMClient()
+        embeddings = await client.embed(names, stage="classification")
+        return dict(zip(names, embeddings, strict=True)), client.embedding_model.value
+
+    async def ensure_classification_embeddings(
+        self, classifications: list[Classification]
+    ) -> list[Classification]:
+        """
+        Embed and store any classifications missing an embedding from the
+        current embedding model (e.g. created before embeddings were stored)
+        """
+        current_model = LLMClient().embedding_model.value
+        stale = [
+            c
+            for c in classifications
+            if c.embedding is None or c.embedding_model != current_model
+        ]
+        if not stale:
+            return classifications
+
+        embeddings, embedding_model = await self.embed_classification_names(
+            [c.name for c in stale]
+        )
+        for classification in stale:
+            classification.embedding = embeddings[classification.name]
+            classification.embedding_model = embedding_model
+
+        # One write for all of them (the existing rows are updated on id)
+        await (
+            self.supabase.table("classifications")
+            .upsert(
+                [
+                    {
+                        "id": str(c.classification_id),
+                        "tenant_id": str(c.tenant_id),
+                        "name": c.name,
+                        "embedding": c.embedding,
+                        "embedding_model": embedding_model,
+                    }
+                    for c in stale
+                ],
+                on_conflict="id",
+            )
+            .execute()
+        )
+
+        return classifications
+
     async def set_classifications(
         self, tenant_id: UUID, classification_names: list[str]
     ) -> list[Classification]:
         """
         Set classifications for a tenant. Creates new ones, keeps existing ones, and deletes missing ones.
+        Only the names of newly created classifications are embedded, best-effort:
+        if embedding fails they are stored without one and embedded later by
+        ensure_classification_embeddings.
         Files linked to deleted classifications will have their classification_id set to NULL.
         """
         # Get existing classifications
@@ -97,7 +177,10 @@ class ClassificationService:
             await (
                 self.supabase.table("classifications")
                 .insert(
-                    [{"tenant_id": str(tenant_id), "name": name} for name in to_create]
+                    [
+                        {"tenant_id": str(tenant_id), "name": name}
+                        for name in sorted(to_create)
+                    ]
                 )
                 .execute()
             )
@@ -125,7 +208,164 @@ class ClassificationService:
             )
 
         # Return updated list
-        return await self.get_classifications(tenant_id)
+        classifications = await self.get_classifications(tenant_id)
+
+        # Embed the new names in one batch; an embedding-provider failure
+        # must not fail classification creation
+        if to_create:
+            try:
+                classifications = await self.ensure_classification_embeddings(
+                    classifications
+                )
+            except Exception as e:
+                print(f"Could not embed new classifications: {e}", flush=True)
+
+        return classifications
+
+    async def assign_nearest_classifications(
+        self, tenant_id: UUID, only_unclassified: bool = True
+    ) -> int:
+        """
+        Assign each of the tenant's files (by default only unclassified ones) its
+        nearest classification by cosine distance, computed in Postgres from the
+        stored embeddings. Returns the number of files whose classification changed
+        """
+        response = await self.supabase.rpc(
+            "assign_nearest_classifications",
+            {
+                "p_tenant_id": str(tenant_id),
+                "p_only_unclassified": only_unclassified,
+            },
+        ).execute()
+
+        return response.data or 0
+
+    async def classify_files_bulk(
+        self, tenant_id: UUID, assignments: dict[UUID, UUID | None]
+    ) -> int:
+        """
+        Apply file_upload_id -> classification_id assignments (None unclassifies)
+        in one RPC per BULK_CLASSIFY_CHUNK_SIZE files. Tenant ownership of the
+        classifications is validated set-wise in the database.
+        Returns the number of files whose classification changed
+        """
+        items = list(assignments.items())
+        updated = 0
+
+        for start in range(0, len(items), BULK_CLASSIFY_CHUNK_SIZE):
+            chunk = items[start : start + BULK_CLASSIFY_CHUNK_SIZE]
+            response = await self.supabase.rpc(
+                "bulk_classify_files",
+                {
+                    "p_tenant_id": str(tenant_id),
+                    "p_file_upload_ids": [str(f) for f, _ in chunk],
+                    "p_classification_ids": [str(c) if c else None for _, c in chunk],
+                },
+            ).execute()
+            updated += response.data or 0
+
+        return updated
+
+    async def get_clustering_state(self, tenant_id: UUID) -> ClusteringState | None:
+        """
+        Load the tenant's persisted clustering model, or None if there is none
+        or it cannot be loaded (the caller then refits)
+        """
+        response = await (
+            self.supabase.table("clustering_models")
+            .select("storage_path")
+            .eq("tenant_id", str(tenant_id))
+            .execute()
+        )
+        if not response.data:
+            return None
+
+        try:
+            artifact = await self.supabase.storage.from_(
+                CLUSTERING_MODELS_BUCKET
+            ).download(response.data[0]["storage_path"])
+            state = await asyncio.to_thread(pickle.loads, artifact)
+        except Exception as e:
+            print(f"Could not load clustering model for {tenant_id}: {e}", flush=True)
+            return None
+
+        return state if isinstance(state, ClusteringState) else None
+
+    async def save_clustering_state(
+        self, tenant_id: UUID, state: ClusteringState
+    ) -> bool:
+        """
+        Persist the tenant's clustering model artifact and its fingerprint.
+        Best-effort: a model that is too large or fails to upload is logged
+        and skipped (the next call refits). Returns whether it was saved
+        """
+        storage_path = f"{tenant_id}/clustering_model.pkl"
+        try:
+            artifact = await asyncio.to_thread(pickle.dumps, state)
+            if len(artifact) > CLUSTERING_MODEL_MAX_BYTES:
+                print(
+                    f"Clustering model for {tenant_id} is {len(artifact)} bytes, "
+                    f"over {CLUSTERING_MODEL_MAX_BYTES}; not persisting",
+                    flush=True,
+                )
+                return False
+
+            await self.supabase.storage.from_(CLUSTERING_MODELS_BUCKET).upload(
+                storage_path,
+                artifact,
+                {"content-type": "application/octet-stream", "upsert": "true"},
+            )
+            await (
+                self.supabase.table("clustering_models")
+                .upsert(
+                    {
+                        "tenant_id": str(tenant_id),
+                        "storage_path": storage_path,
+                        "fingerprint": state.fingerprint,
+                        "document_count": len(state.labels),
+                        "fitted_count": state.fitted_count,
+                        "cluster_count": len(set(state.labels.values()) - {-1}),
+                        "updated_at": "now()",
+                    }
+                )
+                .execute()
+            )
+        except Exception as e:
+            print(f"Could not save clustering model for {tenant_id}: {e}", flush=True)
+            return False
+        return True
+
+    async def get_cluster_names(self, tenant_id: UUID) -> list[ClusterName]:
+        """Get the tenant's cached cluster names and member signatures"""
+        response = await (
+            self.supabase.table("cluster_names")
+            .select("signature, name, member_count")
+            .eq("tenant_id", str(tenant_id))
+            .execute()
+        )
+        return [ClusterName(**row) for row in response.data]
+
+    async def set_cluster_names(
+        self, tenant_id: UUID, cluster_names: list[ClusterName]
+    ) -> None:
+        """Replace the tenant's cached cluster names with the latest clusters"""
+        await (
+            self.supabase.table("cluster_names")
+            .delete()
+            .eq("tenant_id", str(tenant_id))
+            .execute()
+        )
+        if cluster_names:
+            await (
+                self.supabase.table("cluster_names")
+                .insert(
+                    [
+                        {"tenant_id": str(tenant_id), **cluster.model_dump()}
+                        for cluster in cluster_names
+                    ]
+                )
+                .execute()
+            )
 
     async def classify_file(
         self, file_upload_id: UUID, classification_id: UUID
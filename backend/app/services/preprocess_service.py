@@ -1,20 +1,41 @@
+import os
+from dataclasses import asdict
 from uuid import UUID
 
 from fastapi import Depends
 from supabase._async.client import AsyncClient
 
+from app.core.llm_metrics import bind_llm_context
 from app.core.supabase import get_async_supabase
+from app.schemas.preprocess_schemas import ExtractionPriority
 from app.utils.preprocess.embeddings import generate_embedding
-from app.utils.preprocess.pdf_extractor import extract_pdf_data
+from app.utils.preprocess.pdf_download import download_pdf, extraction_footprint
+from app.utils.preprocess.pdf_extractor import (
+    EXTRACTION_MODEL_KEY,
+    PROMPT_VERSION,
+    extract_pdf_data,
+    is_cacheable_extraction,
+)
+from app.utils.preprocess.stage_limits import StageLimits
+
+# Classify each completed extraction against the tenant's stored
+# classification embeddings as soon as it lands
+AUTO_CLASSIFY = os.getenv("PREPROCESS_AUTO_CLASSIFY", "false") == "true"
 
 
 class PreprocessService:
-    def __init__(self, supabase: AsyncClient):
+    def __init__(self, supabase: AsyncClient, limits: StageLimits | None = None):
         self.supabase = supabase
+        self.limits = limits or StageLimits()
 
-    async def created_queued_extraction(self, file_upload_id: UUID) -> UUID:
+    async def created_queued_extraction(
+        self,
+        file_upload_id: UUID,
+        priority: ExtractionPriority = ExtractionPriority.BULK,
+    ) -> UUID:
         """
-        Created an extracted_files entry with status "queued" and returns the extracted_file_id
+        Created an extracted_files entry with status "queued" in the given priority
+        lane and returns the extracted_file_id
         """
 
         result = await (
@@ -23,6 +44,7 @@ class PreprocessService:
                 {
                     "status": "queued",
                     "source_file_id": str(file_upload_id),
+                    "priority": int(priority),
                 }
             )
             .execute()
@@ -30,76 +52,275 @@ class PreprocessService:
 
         return result.data[0]["id"]
 
-    async def process_pdf_upload(self, extracted_file_id: UUID) -> str:
+    async def claim_queued_extractions(
+        self,
+        worker_id: str,
+        batch_size: int,
+        lease_seconds: int,
+        tenant_max_concurrency: int = 0,
+        aging_seconds: int = 300,
+    ) -> list[UUID]:
         """
-        Full preprocessing pipeline:
-        1. Download PDF from storage
-        2. Extract structured data
-        3. Generate embedding
-        4. Store in extracted_files
+        Claim up to batch_size queued extractions for this worker, marking them
+        "processing" under a lease that expires after lease_seconds.
+        Rows are picked by priority lane (promoted one lane per aging_seconds
+        waited), then in weighted round-robin order across tenants, skipping
+        tenants already at their concurrency cap (0 = uncapped)
         """
-        try:
-            # Update status to "processing"
-            await (
-                self.supabase.table("extracted_files")
-                .update({"status": "processing"})
-                .eq("id", str(extracted_file_id))
+        async with self.limits.db:
+            result = await self.supabase.rpc(
+                "claim_extractions",
+                {
+                    "p_worker_id": worker_id,
+                    "p_batch_size": batch_size,
+                    "p_lease_seconds": lease_seconds,
+                    "p_tenant_max_concurrency": tenant_max_concurrency,
+                    "p_aging_seconds": aging_seconds,
+                },
+            ).execute()
+
+        return [UUID(row["extracted_file_id"]) for row in result.data or []]
+
+    async def renew_extraction_leases(
+        self, worker_id: str, extracted_file_ids: list[UUID], lease_seconds: int
+    ) -> None:
+        """
+        Extend the leases this worker holds on in-flight extractions
+        """
+        async with self.limits.db:
+            await self.supabase.rpc(
+                "renew_extraction_leases",
+                {
+                    "p_worker_id": worker_id,
+                    "p_extracted_file_ids": [str(i) for i in extracted_file_ids],
+                    "p_lease_seconds": lease_seconds,
+                },
+            ).execute()
+
+    async def requeue_expired_extractions(self, max_attempts: int) -> int:
+        """
+        Return orphaned "processing" extractions whose lease expired to the queue.
+        Returns the number of requeued extractions
+        """
+        async with self.limits.db:
+            result = await self.supabase.rpc(
+                "requeue_expired_extractions", {"p_max_attempts": max_attempts}
+            ).execute()
+
+        return result.data or 0
+
+    async def release_extraction_leases(self, worker_id: str) -> None:
+        """
+        Hand this worker's unfinished extractions back to the queue (on shutdown)
+        """
+        await (
+            self.supabase.table("extracted_files")
+            .update({"status": "queued", "lease_owner": None, "lease_expires_at": None})
+            .eq("lease_owner", worker_id)
+            .eq("status", "processing")
+            .execute()
+        )
+
+    async def get_cached_extraction(
+        self, content_sha256: str, llm_model: str, prompt_version: str
+    ) -> dict | None:
+        """
+        Look up a previous extraction of identical PDF bytes with the same model
+        and system prompt. Returns {"extracted_data", "embedding"} or None
+        """
+        async with self.limits.db:
+            response = await (
+                self.supabase.table("extraction_cache")
+                .select("extracted_data, embedding")
+                .eq("content_sha256", content_sha256)
+                .eq("llm_model", llm_model)
+                .eq("prompt_version", prompt_version)
+                .limit(1)
                 .execute()
             )
 
-            response = await (
-                self.supabase.table("extracted_files")
-                .select("file_uploads!inner(name, tenant_id)")
-                .eq("id", str(extracted_file_id))
-                .single()
+        return response.data[0] if response.data else None
+
+    async def store_cached_extraction(
+        self,
+        content_sha256: str,
+        llm_model: str,
+        prompt_version: str,
+        extracted_json: dict,
+        embedding_vector: list[float],
+    ) -> None:
+        """
+        Store an extraction in the content-addressed cache
+        """
+        async with self.limits.db:
+            await (
+                self.supabase.table("extraction_cache")
+                .upsert(
+                    {
+                        "content_sha256": content_sha256,
+                        "llm_model": llm_model,
+                        "prompt_version": prompt_version,
+                        "extracted_data": extracted_json,
+                        "embedding": embedding_vector,
+                    }
+                )
                 .execute()
             )
 
+    async def process_pdf_upload(self, extracted_file_id: UUID) -> str:
+        """
+        Full preprocessing pipeline for an extraction claimed by a queue worker:
+        1. Download PDF from storage
+        2. Extract structured data (or reuse a cached extraction of identical bytes)
+        3. Generate embedding
+        4. Store in extracted_files
+        5. Optionally (PREPROCESS_AUTO_CLASSIFY) assign the nearest classification
+        """
+        try:
+            async with self.limits.db:
+                response = await (
+                    self.supabase.table("extracted_files")
+                    .select(
+                        "source_file_id, priority, file_uploads!inner(name, tenant_id)"
+                    )
+                    .eq("id", str(extracted_file_id))
+                    .single()
+                    .execute()
+                )
+
+            file_upload_id = response.data["source_file_id"]
             tenant_id = response.data["file_uploads"]["tenant_id"]
             file_name = response.data["file_uploads"]["name"]
+            # Admin retries exist to fix bad extractions: always re-extract
+            interactive = response.data["priority"] == ExtractionPriority.INTERACTIVE
 
             storage_path = f"{tenant_id}/{file_name}"
 
-            # Download PDF
-            pdf_bytes = await self.supabase.storage.from_("documents").download(
-                storage_path
-            )
+            # Attribute every LLM call for this document to its tenant and total them
+            llm_usage = bind_llm_context(tenant_id, track_usage=True)
+
+            # Stream the PDF to a spooled temp file, hashing it on the way
+            async with self.limits.download:
+                pdf_file, content_sha256, pdf_size = await download_pdf(
+                    self.supabase, storage_path
+                )
             print("PDF downloaded", flush=True)
 
-            # Extract data
-            extracted_json = await extract_pdf_data(pdf_bytes, file_name)
-            print("Data extracted", flush=True)
+            with pdf_file:
+                # Reuse a previous extraction of the same bytes, model and prompt
+                llm_model = EXTRACTION_MODEL_KEY
+                cached = (
+                    None
+                    if interactive
+                    else await self.get_cached_extraction(
+                        content_sha256, llm_model, PROMPT_VERSION
+                    )
+                )
+
+                if cached:
+                    extracted_json = {
+                        **cached["extracted_data"],
+                        "file_name": file_name,
+                        "meta": {
+                            **cached["extracted_data"].get("meta", {}),
+                            "cache_hit": True,
+                        },
+                    }
+                    embedding_vector = cached["embedding"]
+                    print("Extraction cache hit", flush=True)
+                else:
+                    # Extract data, keeping the memory of PDFs in flight (file
+                    # plus base64 copies) under budget. The LLM stage limit is
+                    # taken per request (shard), so sharding cannot multiply it
+                    async with self.limits.pdf_bytes.reserve(
+                        extraction_footprint(pdf_size)
+                    ):
+                        extracted_json = await extract_pdf_data(
+                            pdf_file, file_name, llm_limit=self.limits.llm
+                        )
+                    print("Data extracted", flush=True)
+
+                    # Generate embedding for whole document
+                    async with self.limits.embedding:
+                        embedding_vector = await generate_embedding(extracted_json)
+                    print("Embedding generated", flush=True)
+
+                    # Failed, invalid or partially sharded results are not
+                    # cached, so a retry gets a fresh extraction
+                    if is_cacheable_extraction(extracted_json):
+                        await self.store_cached_extraction(
+                            content_sha256,
+                            llm_model,
+                            PROMPT_VERSION,
+                            extracted_json,
+                            embedding_vector,
+                        )
 
-            # Generate embedding for whole document
-            embedding_vector = await generate_embedding(extracted_json)
-            print("Embedding generated", flush=True)
+            extracted_json["meta"] = {
+                **extracted_json.get("meta", {}),
+                "llm_usage": asdict(llm_usage),
+            }
 
             # Update status to "complete" with extracted data and embedding
-            result = await (
-                self.supabase.table("extracted_files")
-                .update(
-                    {
-                        "status": "completed",
-                        "extracted_data": extracted_json,
-                        "embedding": embedding_vector,
-                    }
+            async with self.limits.db:
+                result = await (
+                    self.supabase.table("extracted_files")
+                    .update(
+                        {
+                            "status": "completed",
+                            "extracted_data": extracted_json,
+                            "embedding": embedding_vector,
+                            "lease_owner": None,
+                            "lease_expires_at": None,
+                        }
+                    )
+                    .eq("id", str(extracted_file_id))
+                    .execute()
                 )
-                .eq("id", str(extracted_file_id))
-                .execute()
-            )
 
             print("Extraction stored", flush=True)
+
+            if AUTO_CLASSIFY:
+                await self.auto_classify(file_upload_id)
+
             return result.data[0]["id"]
         except Exception as e:
             # Update status to "failed" and store error
-            await (
-                self.supabase.table("extracted_files")
-                .update({"status": "failed", "extracted_data": {"error": str(e)}})
-                .eq("id", str(extracted_file_id))
-                .execute()
-            )
+            async with self.limits.db:
+                await (
+                    self.supabase.table("extracted_files")
+                    .update(
+                        {
+                            "status": "failed",
+                            "extracted_data": {"error": str(e)},
+                            "lease_owner": None,
+                            "lease_expires_at": None,
+                        }
+                    )
+                    .eq("id", str(extracted_file_id))
+                    .execute()
+                )
             raise
 
+    async def auto_classify(self, file_upload_id: UUID) -> UUID | None:
+        """
+        Assign a newly extracted, unclassified file its nearest classification
+        in Postgres. Failures are logged and never fail the extraction
+        """
+        try:
+            async with self.limits.db:
+                result = await self.supabase.rpc(
+                    "assign_nearest_classification",
+                    {"p_file_upload_id": str(file_upload_id)},
+                ).execute()
+        except Exception as e:
+            print(f"Auto-classification failed for {file_upload_id}: {e}", flush=True)
+            return None
+
+        if result.data:
+            print(f"Auto-classified as {result.data}", flush=True)
+        return result.data
+
     async def delete_previous_extraction(self, file_upload_id: UUID):
         """
         Delete Previous extracted data entry if one exists
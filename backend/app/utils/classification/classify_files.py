@@ -1,8 +1,13 @@
+import os
+
 import numpy as np
 
 from app.core.litellm import LLMClient
 from app.schemas.classification_schemas import Classification, ExtractedFile
 
+# Files are scored in chunks of this many rows to bound memory on large tenants
+CLASSIFY_CHUNK_SIZE = max(1, int(os.getenv("CLASSIFY_CHUNK_SIZE", 4096)))
+
 
 async def classify_files(
     extracted_files: list[ExtractedFile],
@@ -12,74 +17,78 @@ async def classify_files(
     Classifies extracted files by comparing their embeddings to
     classification name embeddings.
 
-    Each file is assigned the classification with the highest cosine similarity.
+    Each file is assigned the classification with the highest cosine similarity,
+    along with that score and its margin over the runner-up classification.
+    Stored classification embeddings are used when present.
     """
 
     if not extracted_files or not classifications:
         return extracted_files
 
-    client = LLMClient()
-    classification_embeddings = {}
-
-    # Generate embeddings for each classification name
-    print(f"Generating embeddings for {len(classifications)} classifications...")
-    for classification in classifications:
+    # Classifications normally carry their stored name embedding; any without
+    # one are embedded here in a single batched request
+    missing = [c for c in classifications if c.embedding is None]
+    if missing:
+        print(f"Generating embeddings for {len(missing)} classifications...")
         try:
-            emb = await client.embed(classification.name)
-            classification_embeddings[classification.classification_id] = emb
+            embeddings = await LLMClient().embed(
+                [c.name for c in missing], stage="classification"
+            )
+            for classification, embedding in zip(missing, embeddings, strict=True):
+                classification.embedding = embedding
         except Exception as e:
-            print(f"Error generating embedding for '{classification.name}': {e}")
-            continue
+            print(f"Error generating classification embeddings: {e}")
 
-    if not classification_embeddings:
-        print("No classification embeddings generated, returning files unchanged")
+    embedded_classifications = [c for c in classifications if c.embedding]
+    if not embedded_classifications:
+        print("No classification embeddings available, returning files unchanged")
         return extracted_files
 
-    # Assign best matching classification to each file
-    print(f"Classifying {len(extracted_files)} files using embedding similarity...")
+    class_embeddings = [c.embedding for c in embedded_classifications]
+    class_matrix = _normalize(np.asarray(class_embeddings, dtype=np.float32))
+    dimensions = class_matrix.shape[1]
+
+    scorable = []
     for file in extracted_files:
         if file.embedding is None or len(file.embedding) == 0:
             print(f"File {file.name} has no embedding, skipping")
-            continue
-
-        best_similarity = -1
-        best_classification = None
-
-        for class_id, class_emb in classification_embeddings.items():
-            sim = _cosine_similarity(file.embedding, class_emb)
-            if sim > best_similarity:
-                best_similarity = sim
-                best_classification = next(
-                    (c for c in classifications if c.classification_id == class_id),
-                    None,
-                )
-
-        if best_classification:
-            file.classification = best_classification
-            print(
-                f"  {file.name} → {best_classification.name} (similarity: {best_similarity:.3f})"
+        elif len(file.embedding) != dimensions:
+            print(f"File {file.name} has a {len(file.embedding)}-d embedding, skipping")
+        else:
+            scorable.append(file)
+
+    # Assign best matching classification to each file
+    print(f"Classifying {len(scorable)} files using embedding similarity...")
+    for start in range(0, len(scorable), CLASSIFY_CHUNK_SIZE):
+        chunk = scorable[start : start + CLASSIFY_CHUNK_SIZE]
+        file_matrix = _normalize(
+            np.asarray([file.embedding for file in chunk], dtype=np.float32)
+        )
+        indices, scores = _top_k(file_matrix @ class_matrix.T, k=2)
+
+        for i, file in enumerate(chunk):
+            file.classification = embedded_classifications[indices[i, 0]]
+            file.classification_score = float(scores[i, 0])
+            file.classification_margin = (
+                float(scores[i, 0] - scores[i, 1]) if scores.shape[1] > 1 else None
             )
 
     return extracted_files
 
 
-def _cosine_similarity(vec1: list[float], vec2: list[float]) -> float:
+def _normalize(matrix: np.ndarray) -> np.ndarray:
     """
-    Calculate cosine similarity between two vectors.
-
-    Returns a value between -1 and 1:
-    - 1 means vectors point in same direction (very similar)
-    - 0 means vectors are orthogonal (unrelated)
-    - -1 means vectors point in opposite directions (very different)
+    Scale rows to unit length so dot products are cosine similarities.
+    Zero rows stay zero (similarity 0 to everything).
     """
-    v1 = np.array(vec1)
-    v2 = np.array(vec2)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
 
-    dot_product = np.dot(v1, v2)
-    norm1 = np.linalg.norm(v1)
-    norm2 = np.linalg.norm(v2)
 
-    if norm1 == 0 or norm2 == 0:
-        return 0.0
-
-    return float(dot_product / (norm1 * norm2))
+def _top_k(similarities: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Column indices and scores of the k highest similarities in each row,
+    best first. Ties go to the earlier classification.
+    """
+    indices = np.argsort(-similarities, axis=1, kind="stable")[:, :k]
+    return indices, np.take_along_axis(similarities, indices, axis=1)
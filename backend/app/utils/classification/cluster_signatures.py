@@ -0,0 +1,34 @@
+import hashlib
+
+import numpy as np
+
+# Permutations per signature; the Jaccard estimate's standard error is
+# about 1 / sqrt(MINHASH_PERMUTATIONS)
+MINHASH_PERMUTATIONS = 128
+# Mersenne prime for the (a * x + b) mod p hash family; values fit INTEGER
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(0)
+_A = _rng.integers(1, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def minhash_signature(member_ids: list[str]) -> list[int]:
+    """MinHash signature of a cluster's member ids (order-independent)"""
+    hashes = np.fromiter(
+        (
+            int.from_bytes(hashlib.blake2b(m.encode(), digest_size=4).digest(), "big")
+            for m in member_ids
+        ),
+        dtype=np.uint64,
+        count=len(member_ids),
+    )
+    # (len(members), permutations); a < 2^31 and x < 2^32 so no overflow
+    permuted = (hashes[:, None] * _A + _B) % _PRIME
+    return permuted.min(axis=0).astype(np.int64).tolist()
+
+
+def estimated_jaccard(signature: list[int], others: list[list[int]]) -> np.ndarray:
+    """Estimated Jaccard similarity of one signature against many"""
+    if not others:
+        return np.empty(0)
+    return (np.asarray(others) == np.asarray(signature)).mean(axis=1)
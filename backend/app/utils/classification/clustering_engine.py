@@ -0,0 +1,317 @@
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Any
+
+import hdbscan
+import numpy as np
+from sklearn.decomposition import PCA
+from sklearn.preprocessing import normalize
+
+from app.core.compute_pool import COMPUTE_POOL_WORKERS, raise_if_cancelled
+
+# Tenants with more documents than this use the scalable path
+CLUSTER_EXACT_MAX_POINTS = int(os.getenv("CLUSTER_EXACT_MAX_POINTS", 5000))
+# Scalable path: pre-reduction ("pca", "umap" or "none") and its dimensions
+CLUSTER_REDUCER = os.getenv("CLUSTER_REDUCER", "pca")
+CLUSTER_REDUCED_DIMENSIONS = int(os.getenv("CLUSTER_REDUCED_DIMENSIONS", 32))
+# Scalable path: HDBSCAN is fit on a sample of this many points, the rest are
+# assigned to the fitted clusters with approximate_predict
+CLUSTER_CORESET_SIZE = int(os.getenv("CLUSTER_CORESET_SIZE", 20_000))
+# Scalable path: smallest cluster HDBSCAN keeps; defaults to 0.1% of the
+# coreset (20 at 20k) so large tenants don't fragment into thousands of
+# micro-clusters, each needing an LLM naming call
+CLUSTER_SCALABLE_MIN_CLUSTER_SIZE = os.getenv("CLUSTER_SCALABLE_MIN_CLUSTER_SIZE")
+# Core-distance threads per fit; every compute pool worker may fit at once
+CLUSTER_N_JOBS = max(1, (os.cpu_count() or 1) // COMPUTE_POOL_WORKERS)
+PREDICT_CHUNK_SIZE = 10_000
+# Incremental updates of a persisted clustering fall back to a full refit once
+# new or removed documents exceed these fractions of the fitted set, or too
+# many new documents land outside every cluster
+CLUSTER_REFIT_NEW_FRACTION = float(os.getenv("CLUSTER_REFIT_NEW_FRACTION", 0.2))
+CLUSTER_REFIT_REMOVED_FRACTION = float(os.getenv("CLUSTER_REFIT_REMOVED_FRACTION", 0.2))
+CLUSTER_REFIT_OUTLIER_FRACTION = float(os.getenv("CLUSTER_REFIT_OUTLIER_FRACTION", 0.3))
+RANDOM_SEED = 42
+
+
+@dataclass
+class ClusteringModel:
+    """A fitted clusterer (with prediction data) and its pre-reduction"""
+
+    clusterer: hdbscan.HDBSCAN
+    reducer: Any = None
+    normalize_float32: bool = False
+
+    def prepare(self, embeddings: list[list[float]] | np.ndarray) -> np.ndarray:
+        """Normalize and reduce embeddings into the clusterer's space"""
+        if not self.normalize_float32:
+            return normalize(np.array(embeddings))
+
+        points = np.asarray(embeddings, dtype=np.float32)
+        normalize(points, copy=False)
+        return np.concatenate(
+            [
+                _transform(self.reducer, points[start : start + PREDICT_CHUNK_SIZE])
+                for start in range(0, len(points), PREDICT_CHUNK_SIZE)
+            ]
+        )
+
+    def predict(self, embeddings: list[list[float]]) -> tuple[np.ndarray, np.ndarray]:
+        """Assign new points to the fitted clusters; returns (labels, strengths)"""
+        points = self.prepare(embeddings)
+        labels = np.empty(len(points), dtype=np.intp)
+        strengths = np.empty(len(points), dtype=np.float64)
+        for start in range(0, len(points), PREDICT_CHUNK_SIZE):
+            raise_if_cancelled()
+            chunk = slice(start, start + PREDICT_CHUNK_SIZE)
+            labels[chunk], strengths[chunk] = hdbscan.approximate_predict(
+                self.clusterer, points[chunk]
+            )
+        return labels, strengths
+
+
+@dataclass
+class ClusteringState:
+    """
+    A tenant's persisted clustering: the fitted model, the label of every
+    document it has seen, and a fingerprint of that document set
+    """
+
+    model: ClusteringModel
+    labels: dict[str, int]
+    fingerprint: str
+    fitted_count: int
+    embedding_dimensions: int
+    # Documents assigned incrementally (not fitted) since the last refit
+    predicted_count: int = 0
+
+
+def fingerprint_documents(document_ids: list[str]) -> str:
+    """Order-independent fingerprint of a set of documents"""
+    return hashlib.sha256("\n".join(sorted(document_ids)).encode()).hexdigest()
+
+
+def fit_clustering(
+    embeddings: list[list[float]] | np.ndarray,
+) -> tuple[np.ndarray, ClusteringModel]:
+    """
+    Fit HDBSCAN from scratch; returns one label per embedding (-1 = outlier)
+    and the model for later predictions.
+
+    Small tenants use the exact path (HDBSCAN on the full normalized matrix).
+    Above CLUSTER_EXACT_MAX_POINTS documents the scalable path is used.
+    """
+    if len(embeddings) <= CLUSTER_EXACT_MAX_POINTS:
+        return _cluster_exact(embeddings)
+    return _cluster_scalable(embeddings)
+
+
+def update_clustering(
+    document_ids: list[str],
+    embeddings: list[list[float]] | np.ndarray,
+    previous: ClusteringState | None,
+) -> tuple[np.ndarray, ClusteringState, str]:
+    """
+    Cluster a tenant's documents, reusing a persisted clustering if possible.
+    CPU-bound: run via run_compute from async code.
+
+    Returns (labels, state, action) where action is:
+    - "unchanged": same document set as the stored fit, stored labels reused
+    - "incremental": new documents assigned with approximate_predict and
+      removed ones dropped, without refitting
+    - "refit": no usable stored clustering, or drift crossed a threshold
+      (too many new or removed documents, or too many new outliers)
+    """
+    fingerprint = fingerprint_documents(document_ids)
+    dimensions = len(embeddings[0])
+
+    if previous is not None and previous.embedding_dimensions == dimensions:
+        if previous.fingerprint == fingerprint:
+            labels = np.array([previous.labels[d] for d in document_ids])
+            return labels, previous, "unchanged"
+
+        new = [i for i, d in enumerate(document_ids) if d not in previous.labels]
+        current = set(document_ids)
+        removed = sum(1 for d in previous.labels if d not in current)
+        reason = _refit_reason(
+            previous.predicted_count + len(new), removed, previous.fitted_count
+        )
+
+        if reason is None and new:
+            new_labels, _ = previous.model.predict([embeddings[i] for i in new])
+            outlier_fraction = float(np.mean(new_labels == -1))
+            if outlier_fraction > CLUSTER_REFIT_OUTLIER_FRACTION:
+                reason = f"{outlier_fraction:.0%} of new documents are outliers"
+
+        if reason is None:
+            assigned = {
+                d: previous.labels[d] for d in document_ids if d in previous.labels
+            }
+            if new:
+                assigned.update(
+                    {
+                        document_ids[i]: int(label)
+                        for i, label in zip(new, new_labels, strict=True)
+                    }
+                )
+            state = ClusteringState(
+                model=previous.model,
+                labels=assigned,
+                fingerprint=fingerprint,
+                fitted_count=previous.fitted_count,
+                embedding_dimensions=dimensions,
+                predicted_count=previous.predicted_count + len(new),
+            )
+            labels = np.array([assigned[d] for d in document_ids])
+            print(
+                f"Incremental clustering: {len(new)} new, {removed} removed",
+                flush=True,
+            )
+            return labels, state, "incremental"
+
+        print(f"Refitting clustering: {reason}", flush=True)
+
+    raise_if_cancelled()
+    labels, model = fit_clustering(embeddings)
+    state = ClusteringState(
+        model=model,
+        labels={d: int(label) for d, label in zip(document_ids, labels, strict=True)},
+        fingerprint=fingerprint,
+        fitted_count=len(document_ids),
+        embedding_dimensions=dimensions,
+    )
+    return labels, state, "refit"
+
+
+def _refit_reason(new: int, removed: int, fitted_count: int) -> str | None:
+    if new > CLUSTER_REFIT_NEW_FRACTION * fitted_count:
+        return f"{new} documents added since fitting on {fitted_count}"
+    if removed > CLUSTER_REFIT_REMOVED_FRACTION * fitted_count:
+        return f"{removed} of {fitted_count} fitted documents removed"
+    return None
+
+
+def _cluster_exact(
+    embeddings: list[list[float]] | np.ndarray,
+) -> tuple[np.ndarray, ClusteringModel]:
+    normalized_embeddings = normalize(np.array(embeddings))
+
+    clusterer = hdbscan.HDBSCAN(
+        min_cluster_size=2,
+        min_samples=1,
+        metric="euclidean",
+        cluster_selection_method="eom",
+        prediction_data=True,
+    )
+
+    labels = clusterer.fit_predict(normalized_embeddings)
+    return labels, ClusteringModel(_strip_training_data(clusterer))
+
+
+def _cluster_scalable(
+    embeddings: list[list[float]] | np.ndarray,
+) -> tuple[np.ndarray, ClusteringModel]:
+    """
+    Scalable clustering for large tenants:
+    1. float32, L2-normalized embeddings (half the memory of float64)
+    2. PCA (or UMAP) pre-reduction, fit on the coreset
+    3. HDBSCAN on a fixed-seed random coreset, with core distances from a
+       space tree (Boruvka) and an approximate minimum spanning tree
+    4. every other point assigned via hdbscan.approximate_predict
+    """
+    points = np.asarray(embeddings, dtype=np.float32)
+    normalize(points, copy=False)
+
+    rng = np.random.default_rng(RANDOM_SEED)
+    coreset_size = min(len(points), CLUSTER_CORESET_SIZE)
+    coreset = np.sort(rng.choice(len(points), size=coreset_size, replace=False))
+    print(
+        f"Scalable clustering: {len(points)} points, coreset of {coreset_size}, "
+        f"{CLUSTER_REDUCER} reduction",
+        flush=True,
+    )
+
+    reducer = _fit_reducer(points[coreset])
+    reduced = np.concatenate(
+        [
+            _transform(reducer, points[start : start + PREDICT_CHUNK_SIZE])
+            for start in range(0, len(points), PREDICT_CHUNK_SIZE)
+        ]
+    )
+    del points
+    raise_if_cancelled()
+
+    clusterer = hdbscan.HDBSCAN(
+        min_cluster_size=_scalable_min_cluster_size(coreset_size),
+        min_samples=1,
+        metric="euclidean",
+        cluster_selection_method="eom",
+        algorithm="boruvka_kdtree",
+        approx_min_span_tree=True,
+        core_dist_n_jobs=CLUSTER_N_JOBS,
+        prediction_data=True,
+    )
+    labels = np.empty(len(reduced), dtype=np.intp)
+    labels[coreset] = clusterer.fit_predict(reduced[coreset])
+
+    remaining = np.setdiff1d(np.arange(len(reduced)), coreset, assume_unique=True)
+    for start in range(0, len(remaining), PREDICT_CHUNK_SIZE):
+        raise_if_cancelled()
+        chunk = remaining[start : start + PREDICT_CHUNK_SIZE]
+        labels[chunk], _ = hdbscan.approximate_predict(clusterer, reduced[chunk])
+
+    return labels, ClusteringModel(
+        _strip_training_data(clusterer), reducer, normalize_float32=True
+    )
+
+
+def _scalable_min_cluster_size(coreset_size: int) -> int:
+    if CLUSTER_SCALABLE_MIN_CLUSTER_SIZE:
+        return max(2, int(CLUSTER_SCALABLE_MIN_CLUSTER_SIZE))
+    return max(2, coreset_size // 1000)
+
+
+def _strip_training_data(clusterer: hdbscan.HDBSCAN) -> hdbscan.HDBSCAN:
+    """
+    Drop fitted state approximate_predict doesn't use, so the persisted model
+    is about one copy of the training matrix (the prediction KD-tree) rather
+    than three plus the spanning trees
+    """
+    prediction_data = clusterer.prediction_data_
+    # approximate_predict only checks raw_data's width
+    prediction_data.raw_data = prediction_data.raw_data[:0]
+    prediction_data.exemplars = []
+    clusterer._raw_data = None
+    clusterer._min_spanning_tree = None
+    clusterer._single_linkage_tree = None
+    clusterer._outlier_scores = None
+    return clusterer
+
+
+def _fit_reducer(sample: np.ndarray) -> Any:
+    """Fit the configured reducer (PCA, UMAP or None) on sample"""
+    dimensions = min(CLUSTER_REDUCED_DIMENSIONS, sample.shape[1], len(sample))
+
+    if CLUSTER_REDUCER == "pca":
+        return PCA(
+            n_components=dimensions, svd_solver="randomized", random_state=RANDOM_SEED
+        ).fit(sample)
+
+    if CLUSTER_REDUCER == "umap":
+        from umap import UMAP
+
+        return UMAP(
+            n_components=dimensions,
+            n_neighbors=15,
+            min_dist=0.0,
+            metric="cosine",
+            random_state=RANDOM_SEED,
+        ).fit(sample)
+
+    return None
+
+
+def _transform(reducer: Any, chunk: np.ndarray) -> np.ndarray:
+    if reducer is None:
+        return chunk
+    return reducer.transform(chunk).astype(np.float32)
@@ -1,6 +1,10 @@
+import asyncio
+
+import numpy as np
 from sklearn.cluster import DBSCAN
 from umap import UMAP
 
+from app.core.compute_pool import raise_if_cancelled, run_compute
 from app.schemas.classification_schemas import (
     DocumentPoint,
     EmbeddingDataset,
@@ -23,20 +27,31 @@ async def extract_embedding_data(
     )
 
 
-async def reduce_to_visualization(dataset: EmbeddingDataset) -> VisualizationResponse:
+def reduce_and_cluster(embeddings: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    UMAP to 2D, then DBSCAN; returns (coords_2d, cluster_labels).
+    CPU-bound: run via run_compute from async code.
+    """
     # UMAP reduction
     reducer = UMAP(
         n_components=2,
-        n_neighbors=min(15, dataset.count - 1),
+        n_neighbors=min(15, len(embeddings) - 1),
         min_dist=0.1,
         metric="cosine",
         random_state=42,
     )
-    coords_2d = reducer.fit_transform(dataset.to_numpy())
+    coords_2d = reducer.fit_transform(embeddings)
+    raise_if_cancelled()
 
     # Clustering
     clusterer = DBSCAN(eps=0.5, min_samples=2, metric="euclidean")
     cluster_labels = clusterer.fit_predict(coords_2d)
+    return coords_2d, cluster_labels
+
+
+async def reduce_to_visualization(dataset: EmbeddingDataset) -> VisualizationResponse:
+    embeddings = await asyncio.to_thread(dataset.to_numpy)
+    coords_2d, cluster_labels = await run_compute(reduce_and_cluster, embeddings)
 
     # Build response
     documents = [
@@ -1,19 +1,44 @@
-import hdbscan
+import asyncio
+import json
+import os
+
 import numpy as np
-from sklearn.preprocessing import normalize
 
+from app.core.compute_pool import run_compute
 from app.core.litellm import LLMClient
-from app.schemas.classification_schemas import ExtractedFile
+from app.schemas.classification_schemas import ClusterName, ExtractedFile
+from app.utils.classification.cluster_signatures import (
+    estimated_jaccard,
+    minhash_signature,
+)
+from app.utils.classification.clustering_engine import (
+    ClusteringState,
+    update_clustering,
+)
+
+# Cluster naming calls in flight at once
+CLUSTER_NAMING_CONCURRENCY = max(1, int(os.getenv("CLUSTER_NAMING_CONCURRENCY", 8)))
+# Name all clusters in one structured JSON call instead of one call per cluster
+CLUSTER_NAMING_SINGLE_CALL = os.getenv("CLUSTER_NAMING_SINGLE_CALL", "false") == "true"
+# Clusters at least this similar (estimated Jaccard of members) to a cached
+# cluster reuse its name without an LLM call
+CLUSTER_NAME_CACHE_THRESHOLD = float(os.getenv("CLUSTER_NAME_CACHE_THRESHOLD", 0.8))
 
 
 async def create_classifications(
     extracted_files: list[ExtractedFile],
     initial_classifications: list[str],
-) -> list[str]:
+    clustering_state: ClusteringState | None = None,
+    cluster_name_cache: list[ClusterName] | None = None,
+) -> tuple[list[str], ClusteringState | None, list[ClusterName] | None]:
     """
     Analyzes extracted files using clustering, then uses LLM to name clusters.
-    LLM is biased toward reusing existing classification names when applicable.
-    Returns the final set of classifications based on actual file content.
+    LLM is biased toward reusing existing classification names when applicable,
+    and clusters matching one in cluster_name_cache keep their cached name.
+    Returns the final set of classifications based on actual file content,
+    the tenant's updated clustering state (incrementally updated or refit from
+    clustering_state; None if unchanged, so there is nothing to persist) and
+    the named clusters to persist for the next call.
     """
     embeddings = []
     valid_files = []
@@ -27,19 +52,19 @@ async def create_classifications(
         print(
             f"Not enough files for clustering ({len(embeddings)}), returning initial classifications"
         )
-        return initial_classifications
-
-    embeddings_array = np.array(embeddings)
-    normalized_embeddings = normalize(embeddings_array)
+        return initial_classifications, None, None
 
-    clusterer = hdbscan.HDBSCAN(
-        min_cluster_size=2,
-        min_samples=1,
-        metric="euclidean",
-        cluster_selection_method="eom",
+    # New documents are assigned to the persisted clusters when drift is small;
+    # otherwise exact HDBSCAN for small tenants, coreset + approximate_predict
+    # for large; clustering runs in the compute pool, off the event loop
+    cluster_labels, clustering_state, action = await run_compute(
+        update_clustering,
+        [str(file.extracted_file_id) for file in valid_files],
+        # float32 halves the shared-memory transfer and the worker's working set
+        await asyncio.to_thread(np.array, embeddings, dtype=np.float32),
+        clustering_state,
     )
-
-    cluster_labels = clusterer.fit_predict(normalized_embeddings)
+    print(f"Clustering {action}")
 
     clusters = {}
     for i, label in enumerate(cluster_labels):
@@ -50,9 +75,6 @@ async def create_classifications(
     outliers = clusters.pop(-1, [])
     print(f"Found {len(clusters)} clusters, {len(outliers)} outliers")
 
-    client = LLMClient()
-    classification_names = []
-
     # Build existing classifications context
     existing_context = ""
     if initial_classifications:
@@ -61,15 +83,107 @@ async def create_classifications(
 
 """
 
-    for cluster_id, files_in_cluster in clusters.items():
-        print(f"Analyzing cluster {cluster_id} with {len(files_in_cluster)} files...")
+    # Name clusters in a stable (cluster id) order so results are deterministic
+    ordered_clusters = sorted(clusters.items())
+    signatures = [
+        minhash_signature([str(file.extracted_file_id) for file in files_in_cluster])
+        for _, files_in_cluster in ordered_clusters
+    ]
+
+    # Only new or changed clusters are sent to the LLM
+    names = _cached_names(
+        signatures, cluster_name_cache or [], set(initial_classifications)
+    )
+    uncached = [
+        cluster
+        for cluster, name in zip(ordered_clusters, names, strict=True)
+        if name is None
+    ]
+    print(f"{len(ordered_clusters) - len(uncached)} cluster names reused from cache")
+
+    if uncached:
+        client = LLMClient()
+
+        new_names = None
+        if CLUSTER_NAMING_SINGLE_CALL:
+            new_names = await _name_clusters_in_one_call(
+                client, uncached, existing_context
+            )
+
+        if new_names is None:
+            semaphore = asyncio.Semaphore(CLUSTER_NAMING_CONCURRENCY)
+            new_names = await asyncio.gather(
+                *(
+                    _name_cluster(
+                        client,
+                        cluster_id,
+                        files_in_cluster,
+                        existing_context,
+                        semaphore,
+                    )
+                    for cluster_id, files_in_cluster in uncached
+                )
+            )
+
+        new_names_iter = iter(new_names)
+        names = [name if name is not None else next(new_names_iter) for name in names]
+
+    named_clusters = [
+        ClusterName(signature=signature, name=name, member_count=len(files_in_cluster))
+        for signature, name, (_, files_in_cluster) in zip(
+            signatures, names, ordered_clusters, strict=True
+        )
+    ]
+
+    # Dedupe in case multiple clusters matched the same classification,
+    # keeping first-seen (cluster) order
+    final_classifications = list(dict.fromkeys(names))
+    print(f"Final classifications: {final_classifications}")
+    # The worker returns a copy even when nothing changed; only save real updates
+    updated_state = None if action == "unchanged" else clustering_state
+    return final_classifications, updated_state, named_clusters
+
+
+def _cached_names(
+    signatures: list[list[int]],
+    cluster_name_cache: list[ClusterName],
+    current_names: set[str],
+) -> list[str | None]:
+    """
+    Cached name of the most similar cached cluster for each signature, or
+    None if none clears CLUSTER_NAME_CACHE_THRESHOLD. Names no longer among
+    the tenant's classifications are not reused.
+    """
+    cache = [cached for cached in cluster_name_cache if cached.name in current_names]
+    cached_signatures = [cached.signature for cached in cache]
 
-        sample_texts = []
-        for file in files_in_cluster[:5]:
-            text = _extract_text_from_file(file)
-            sample_texts.append(text)
+    names: list[str | None] = []
+    for signature in signatures:
+        similarity = estimated_jaccard(signature, cached_signatures)
+        best = int(similarity.argmax()) if len(similarity) else None
+        if best is not None and similarity[best] >= CLUSTER_NAME_CACHE_THRESHOLD:
+            names.append(cache[best].name)
+        else:
+            names.append(None)
+    return names
 
-        prompt = f"""{existing_context}Analyze these similar documents and classify them.
+
+def _sample_texts(files_in_cluster: list[ExtractedFile]) -> list[str]:
+    return [_extract_text_from_file(file) for file in files_in_cluster[:5]]
+
+
+async def _name_cluster(
+    client: LLMClient,
+    cluster_id: int,
+    files_in_cluster: list[ExtractedFile],
+    existing_context: str,
+    semaphore: asyncio.Semaphore,
+) -> str:
+    """Name one cluster with its own LLM call"""
+    print(f"Analyzing cluster {cluster_id} with {len(files_in_cluster)} files...")
+    sample_texts = _sample_texts(files_in_cluster)
+
+    prompt = f"""{existing_context}Analyze these similar documents and classify them.
 
 Sample documents from this cluster:
 {chr(10).join(f"Document {i + 1}: {text}" for i, text in enumerate(sample_texts))}
@@ -78,18 +192,64 @@ If documents match an existing classification, respond with that EXACT name (cas
 Otherwise, create a new concise classification name.
 Respond with ONLY the classification name, no explanation or punctuation."""
 
-        response = await client.chat(prompt)
-        category_name = response.choices[0].message.content
-        if not category_name:
-            category_name = f"Document Type {cluster_id}"
+    async with semaphore:
+        response = await client.chat(prompt, stage="cluster_naming")
 
-        classification_names.append(category_name.strip())
-        print(f"  → Named: {category_name.strip()}")
+    category_name = response.choices[0].message.content
+    if not category_name:
+        category_name = f"Document Type {cluster_id}"
 
-    # Dedupe in case multiple clusters matched the same classification
-    final_classifications = list(set(classification_names))
-    print(f"Final classifications: {final_classifications}")
-    return final_classifications
+    print(f"  → Cluster {cluster_id} named: {category_name.strip()}")
+    return category_name.strip()
+
+
+async def _name_clusters_in_one_call(
+    client: LLMClient,
+    ordered_clusters: list[tuple[int, list[ExtractedFile]]],
+    existing_context: str,
+) -> list[str] | None:
+    """
+    Name every cluster with a single structured JSON call.
+    Returns names in cluster order, or None if the response is unusable
+    """
+    print(f"Naming {len(ordered_clusters)} clusters in one request...")
+    cluster_blocks = []
+    for cluster_id, files_in_cluster in ordered_clusters:
+        samples = "\n".join(
+            f"  Document {i + 1}: {text}"
+            for i, text in enumerate(_sample_texts(files_in_cluster))
+        )
+        cluster_blocks.append(f"Cluster {cluster_id}:\n{samples}")
+
+    prompt = f"""{existing_context}Each cluster below groups similar documents. Classify every cluster.
+
+{chr(10).join(cluster_blocks)}
+
+If a cluster matches an existing classification, use that EXACT name (case-sensitive).
+Otherwise, create a new concise classification name.
+Return JSON mapping each cluster number to its name, e.g. {{"0": "Invoices", "1": "Contracts"}}"""
+
+    try:
+        response = await client.chat(prompt, json_response=True, stage="cluster_naming")
+        named = json.loads(response.choices[0].message.content)
+    except Exception as e:
+        print(f"Single-call cluster naming failed, naming per cluster: {e}")
+        return None
+
+    if not isinstance(named, dict):
+        print("Single-call cluster naming returned no mapping, naming per cluster")
+        return None
+
+    names = []
+    for cluster_id, _ in ordered_clusters:
+        name = named.get(str(cluster_id))
+        names.append(
+            name.strip()
+            if isinstance(name, str) and name.strip()
+            else f"Document Type {cluster_id}"
+        )
+        print(f"  → Cluster {cluster_id} named: {names[-1]}")
+    return names
 
 
 def _extract_text_from_file(file: ExtractedFile) -> str:
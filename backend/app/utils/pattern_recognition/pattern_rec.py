@@ -78,7 +78,9 @@ async def analyze_category_relationships(
     """
     # Call LLM
     client = LLMClient()
-    response = await client.chat(prompt, json_response=True)
+    response = await client.chat(
+        prompt, json_response=True, stage="relationship_analysis"
+    )
 
     # Parse response
     response_text = response.choices[0].message.content.strip()
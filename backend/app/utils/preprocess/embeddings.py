@@ -18,7 +18,7 @@ async def generate_embedding(extracted_json: dict) -> list[float]:
     text = _json_to_text(extracted_json)
 
     # Generate embedding using Gemini
-    embedding = await client.embed(text)
+    embedding = await client.embed(text, stage="document_embedding")
 
     return embedding
 
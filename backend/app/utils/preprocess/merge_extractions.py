@@ -0,0 +1,79 @@
+import json
+from collections import Counter
+from typing import Any
+
+
+def merge_extractions(parts: list[Any]) -> tuple[Any, dict[str, list[Any]]]:
+    """
+    Deterministically merge the JSON extracted from several page-range shards.
+
+    Parts are merged in shard (page) order:
+    - objects are merged key by key, keeping first-seen key order
+    - arrays (e.g. axis tables) are concatenated, dropping exact duplicates
+    - scalars (e.g. payload, model) are reconciled by majority vote across
+      shards, ties going to the earliest shard
+
+    Returns the merged value and a map of JSON path -> distinct values for every
+    scalar that shards disagreed on.
+    """
+    conflicts: dict[str, list[Any]] = {}
+    merged = _merge_values([p for p in parts if p is not None], "$", conflicts)
+    return merged, conflicts
+
+
+def _merge_values(values: list[Any], path: str, conflicts: dict) -> Any:
+    if not values:
+        return None
+
+    if all(isinstance(v, dict) for v in values):
+        return _merge_dicts(values, path, conflicts)
+
+    if any(isinstance(v, list) for v in values):
+        items = []
+        for v in values:
+            items.extend(v if isinstance(v, list) else [v])
+        return _dedupe(items)
+
+    dicts = [v for v in values if isinstance(v, dict)]
+    if dicts:
+        # Structured value in some shards, bare scalar in others: keep the structure
+        conflicts[path] = _dedupe(values)
+        return _merge_dicts(dicts, path, conflicts)
+
+    return _reconcile_scalars(values, path, conflicts)
+
+
+def _merge_dicts(dicts: list[dict], path: str, conflicts: dict) -> dict:
+    merged = {}
+    for key in dict.fromkeys(k for d in dicts for k in d):
+        values = [d[key] for d in dicts if d.get(key) not in (None, "")]
+        if values:
+            merged[key] = _merge_values(values, f"{path}.{key}", conflicts)
+    return merged
+
+
+def _reconcile_scalars(values: list[Any], path: str, conflicts: dict) -> Any:
+    distinct = _dedupe(values)
+    if len(distinct) == 1:
+        return distinct[0]
+
+    conflicts[path] = distinct
+    counts = Counter(_key(v) for v in values)
+    best = max(counts.values())
+    # distinct preserves shard order, so the earliest shard wins ties
+    return next(v for v in distinct if counts[_key(v)] == best)
+
+
+def _dedupe(items: list[Any]) -> list[Any]:
+    seen = set()
+    unique = []
+    for item in items:
+        key = _key(item)
+        if key not in seen:
+            seen.add(key)
+            unique.append(item)
+    return unique
+
+
+def _key(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False)
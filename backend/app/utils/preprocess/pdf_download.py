@@ -0,0 +1,64 @@
+import hashlib
+import os
+import tempfile
+
+import httpx
+from supabase._async.client import AsyncClient
+
+# Downloads larger than this spill from memory to a temporary file
+SPOOL_MAX_BYTES = int(os.getenv("PDF_SPOOL_MAX_BYTES", 8 * 1024 * 1024))
+CHUNK_SIZE = 1024 * 1024
+SIGNED_URL_EXPIRES_IN = 300
+
+_http_client: httpx.AsyncClient | None = None
+
+
+def extraction_footprint(pdf_size: int) -> int:
+    """
+    Memory one document's extraction holds, for the in-flight byte budget:
+    the spooled PDF if it stayed in memory, plus the base64 data URL sent to
+    the LLM and the buffer it is decoded from (4/3 of the PDF each)
+    """
+    base64_size = 4 * -(-pdf_size // 3)
+    in_memory = pdf_size if pdf_size <= SPOOL_MAX_BYTES else 0
+    return in_memory + 2 * base64_size
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0))
+    return _http_client
+
+
+async def download_pdf(
+    supabase: AsyncClient, storage_path: str, bucket: str = "documents"
+) -> tuple[tempfile.SpooledTemporaryFile, str, int]:
+    """
+    Stream a file from storage into a spooled temporary file, hashing it on
+    the way so the whole document is never held as one bytes object.
+
+    Returns (file positioned at 0, sha256 hex digest, size in bytes).
+    The caller owns the file and must close it.
+    """
+    signed = await supabase.storage.from_(bucket).create_signed_url(
+        storage_path, SIGNED_URL_EXPIRES_IN
+    )
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        async with _get_http_client().stream("GET", signed["signedURL"]) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                spool.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+    except BaseException:
+        spool.close()
+        raise
+
+    spool.seek(0)
+    return spool, digest.hexdigest(), size
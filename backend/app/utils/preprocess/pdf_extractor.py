@@ -1,10 +1,16 @@
+import asyncio
+import hashlib
 import json
 import os
+from contextlib import nullcontext
+from typing import Any, BinaryIO
 
 from app.core.litellm import LLMClient, ModelType
+from app.schemas.preprocess_schemas import PdfInspection
+from app.utils.preprocess.merge_extractions import merge_extractions
+from app.utils.preprocess.pdf_inspector import format_page_text, inspect_pdf, pdf_subset
 
-model = LLMClient()
-model.set_system_prompt(
+SYSTEM_PROMPT = (
     "You are a PDF→JSON structurer for manufacturing/robotics documents. "
     "Return ONE valid JSON object only (no markdown). Keep only meaningful specs "
     "(manufacturer, model, document identifiers, key specs like payload/reach/"
@@ -13,33 +19,292 @@ model.set_system_prompt(
     "Do not invent values; omit if missing."
 )
 
+PDF_PROMPT = "Extract tables"
+
+TEXT_PROMPT = (
+    "Extract tables from this document. Its text layer was extracted locally "
+    "with the page layout preserved, so table columns are aligned by whitespace."
+)
+
+MIXED_PROMPT = (
+    "Extract tables from this document. The text layer of some pages was "
+    "extracted locally (below, layout preserved); the attached PDF contains only "
+    "the remaining scanned pages. Combine both into one JSON object."
+)
+
+# Changes whenever any prompt changes, invalidating cached extractions
+PROMPT_VERSION = hashlib.sha256(
+    "\n".join([SYSTEM_PROMPT, PDF_PROMPT, TEXT_PROMPT, MIXED_PROMPT]).encode("utf-8")
+).hexdigest()[:16]
+
+# Model cascade: try the fast tier first and escalate to the strong tier only
+# when its output fails validation. Development never escalates past Flash.
+FAST_LLM_MODEL = ModelType.GEMINI_FLASH
+STRONG_LLM_MODEL = (
+    ModelType.GEMINI_FLASH
+    if os.getenv("ENVIRONMENT") == "development"
+    else ModelType.GEMINI_PRO
+)
+MODEL_CASCADE = os.getenv("PDF_MODEL_CASCADE", "true") == "true"
+
+# Documents above these sizes skip the fast tier and go straight to the strong one
+STRONG_MODEL_MIN_PAGES = int(os.getenv("PDF_STRONG_MODEL_MIN_PAGES", 60))
+STRONG_MODEL_MIN_SCANNED_PAGES = int(
+    os.getenv("PDF_STRONG_MODEL_MIN_SCANNED_PAGES", 10)
+)
+
+# Minimal expected shape of a valid extraction
+MIN_EXTRACTED_FIELDS = int(os.getenv("PDF_MIN_EXTRACTED_FIELDS", 3))
+REQUIRED_KEYS = [k for k in os.getenv("PDF_REQUIRED_KEYS", "").split(",") if k]
+
+# Identifies the model configuration in the extraction cache key
+EXTRACTION_MODEL_KEY = (
+    f"cascade:{FAST_LLM_MODEL.value}>{STRONG_LLM_MODEL.value}"
+    if MODEL_CASCADE and FAST_LLM_MODEL != STRONG_LLM_MODEL
+    else STRONG_LLM_MODEL.value
+)
+
+# Use the local text layer instead of sending whole PDFs when possible
+LOCAL_TEXT_EXTRACTION = os.getenv("PDF_LOCAL_TEXT_EXTRACTION", "true") == "true"
+
+# PDFs with more pages than this are extracted as concurrent page-range shards
+SHARD_PAGES = max(1, int(os.getenv("PDF_SHARD_PAGES", 20)))
+SHARD_CONCURRENCY = max(1, int(os.getenv("PDF_SHARD_CONCURRENCY", 4)))
+
+model = LLMClient()
+model.set_system_prompt(SYSTEM_PROMPT)
+
+
+def _page_shards(page_count: int) -> list[list[int]]:
+    """Split 0-based page indices into contiguous ranges of PDF_SHARD_PAGES"""
+    return [
+        list(range(start, min(start + SHARD_PAGES, page_count)))
+        for start in range(0, page_count, SHARD_PAGES)
+    ]
+
+
+def _parse_json(response) -> Any:
+    text = response.choices[0].message.content.strip()
+    try:
+        return json.loads(text)
+    except Exception:
+        return {"error": "LLM did not return JSON"}
+
+
+def _is_error(data: Any) -> bool:
+    return isinstance(data, dict) and set(data) == {"error"}
+
+
+def is_cacheable_extraction(extraction: dict) -> bool:
+    """
+    Whether an extract_pdf_data result is good enough to reuse for identical
+    bytes: parsed, passed validation, and (if sharded) no shard failed
+    """
+    meta = extraction.get("meta", {})
+    return (
+        not _is_error(extraction["result"])
+        and meta.get("validation_failure") is None
+        and not any(shard["failed"] for shard in meta.get("shards", []))
+    )
+
+
+def _count_fields(data: Any) -> int:
+    """Count non-empty scalar values anywhere in the extracted JSON"""
+    if isinstance(data, dict):
+        return sum(_count_fields(v) for v in data.values())
+    if isinstance(data, list):
+        return sum(_count_fields(v) for v in data)
+    return 0 if data in (None, "") else 1
+
+
+def _validation_failure(data: Any, finish_reason: str | None) -> str | None:
+    """Return why an extraction fails the minimal expected shape, or None"""
+    if finish_reason == "length":
+        return "truncated"
+    if _is_error(data):
+        return "unparseable"
+    if not isinstance(data, dict):
+        return "not an object"
+    if _count_fields(data) < MIN_EXTRACTED_FIELDS:
+        return "too few fields"
+    missing = [k for k in REQUIRED_KEYS if data.get(k) in (None, "", [], {})]
+    if missing:
+        return f"missing keys: {', '.join(missing)}"
+    return None
+
+
+def _cascade_models(inspection: PdfInspection) -> list[ModelType]:
+    """Models to try in order for this document"""
+    if not MODEL_CASCADE or FAST_LLM_MODEL == STRONG_LLM_MODEL:
+        return [STRONG_LLM_MODEL]
+    if (
+        inspection.page_count >= STRONG_MODEL_MIN_PAGES
+        or len(inspection.scanned_pages) >= STRONG_MODEL_MIN_SCANNED_PAGES
+    ):
+        return [STRONG_LLM_MODEL]
+    return [FAST_LLM_MODEL, STRONG_LLM_MODEL]
+
+
+async def _build_request(
+    pdf: bytes | BinaryIO,
+    inspection: PdfInspection,
+    pages: list[int] | None,
+    pdf_lock: asyncio.Lock,
+) -> tuple[str, bytes | BinaryIO | None, str]:
+    """
+    Build the prompt and PDF payload for one page range (None = whole document).
+    Returns (content, pdf payload or None, source).
+    pdf_lock serialises local reads of the shared PDF file between shards.
+
+    What the LLM receives depends on the local inspection:
+    - text-native pages: only the locally extracted text (no PDF upload)
+    - mixed pages: the extracted text plus a PDF of just the scanned pages
+    - scanned, encrypted or unparseable PDFs: the PDF itself
+    """
+    all_pages = list(range(inspection.page_count)) if pages is None else pages
+    use_text = LOCAL_TEXT_EXTRACTION and inspection.has_text_layer
+    text_pages = [i for i in all_pages if use_text and i in inspection.text_pages]
+    vision_pages = [i for i in all_pages if i not in text_pages]
+
+    if text_pages and not vision_pages:
+        page_text = format_page_text(inspection, text_pages)
+        return f"{TEXT_PROMPT}\n\n{page_text}", None, "local-text"
+
+    if text_pages:
+        page_text = format_page_text(inspection, text_pages)
+        async with pdf_lock:
+            scanned_pdf = await asyncio.to_thread(pdf_subset, pdf, vision_pages)
+        return f"{MIXED_PROMPT}\n\n{page_text}", scanned_pdf, "local-text+gemini-pdf"
+
+    if pages is None:
+        return PDF_PROMPT, pdf, "gemini-pdf-only"
+
+    async with pdf_lock:
+        shard_pdf = await asyncio.to_thread(pdf_subset, pdf, pages)
+    return PDF_PROMPT, shard_pdf, "gemini-pdf-only"
+
+
+async def _extract_pages(
+    pdf: bytes | BinaryIO,
+    inspection: PdfInspection,
+    pages: list[int] | None,
+    models: list[ModelType],
+    pdf_lock: asyncio.Lock,
+    llm_limit: asyncio.Semaphore | None,
+) -> tuple[Any, dict]:
+    """
+    Extract one page range, escalating through models until the output passes
+    validation. Returns (data, meta describing the source and chosen tier).
+    Each LLM request holds a llm_limit permit while it runs.
+    """
+    content, payload, source = await _build_request(pdf, inspection, pages, pdf_lock)
+    meta = {"source": source, "escalated": False}
+
+    for i, llm_model in enumerate(models):
+        # Pass the model per call: this client is shared by every queue worker
+        async with llm_limit or nullcontext():
+            response = await model.chat(
+                content,
+                pdf_bytes=payload,
+                json_response=True,
+                model=llm_model,
+                stage="extraction",
+            )
+        data = _parse_json(response)
+        failure = _validation_failure(data, response.choices[0].finish_reason)
+
+        meta["llm_model"] = llm_model.value
+        meta["llm_tier"] = llm_model.name
+        if failure is None or i == len(models) - 1:
+            meta["validation_failure"] = failure
+            return data, meta
+
+        print(f"Escalating from {llm_model.name}: {failure}", flush=True)
+        meta["escalated"] = True
+        meta["escalation_reason"] = failure
+
+    raise ValueError("No models to extract with")
+
 
 async def extract_pdf_data(
-    pdf_bytes: bytes,
+    pdf: bytes | BinaryIO,
     file_name: str,
-    llm_model: ModelType = (
-        ModelType.GEMINI_FLASH
-        if os.getenv("ENVIRONMENT") == "development"
-        else ModelType.GEMINI_PRO
-    ),
+    llm_model: ModelType | None = None,
+    llm_limit: asyncio.Semaphore | None = None,
 ) -> dict:
-    model.set_model(llm_model)
-    response = await model.chat(
-        "Extract tables", pdf_bytes=pdf_bytes, json_response=True
-    )
+    """
+    Extract structured JSON from a PDF given as bytes or a seekable binary file
+    (e.g. the spooled download), which is read incrementally rather than copied.
 
-    text = response.choices[0].message.content.strip()
+    Unless llm_model pins a single model, each request runs on the fast tier
+    first and is re-run on the strong tier only if its JSON fails validation;
+    large or heavily scanned documents go straight to the strong tier.
 
-    print("JSON response received", flush=True)
-    try:
-        data = json.loads(text)
-    except Exception:
-        data = {"error": "LLM did not return JSON"}
+    PDFs longer than PDF_SHARD_PAGES are split into page ranges that are
+    extracted concurrently (at most PDF_SHARD_CONCURRENCY at a time) and merged
+    deterministically, so latency grows with the shard size rather than the
+    document size.
+
+    llm_limit, if given, bounds LLM requests rather than documents: every
+    shard request takes its own permit, so the pipeline-wide extraction
+    concurrency is exactly the limit regardless of sharding.
+    """
+    inspection = await asyncio.to_thread(inspect_pdf, pdf)
+    pdf_lock = asyncio.Lock()
+    models = [llm_model] if llm_model else _cascade_models(inspection)
+
+    meta = {
+        "prompt_version": PROMPT_VERSION,
+        "model_cascade": [m.value for m in models],
+        "inspection": inspection.model_dump(),
+    }
+
+    if not inspection.readable or inspection.page_count <= SHARD_PAGES:
+        data, request_meta = await _extract_pages(
+            pdf, inspection, None, models, pdf_lock, llm_limit
+        )
+        meta.update(request_meta)
+    else:
+        shards = _page_shards(inspection.page_count)
+        semaphore = asyncio.Semaphore(SHARD_CONCURRENCY)
+
+        async def extract_shard(pages: list[int]) -> tuple[Any, dict]:
+            async with semaphore:
+                return await _extract_pages(
+                    pdf, inspection, pages, models, pdf_lock, llm_limit
+                )
+
+        results = await asyncio.gather(*(extract_shard(pages) for pages in shards))
+
+        parts = [r for r, _ in results if not _is_error(r)]
+        data, conflicts = (
+            merge_extractions(parts)
+            if parts
+            else ({"error": "LLM did not return JSON"}, {})
+        )
+        # The document's tier is the strongest tier any shard needed
+        strongest = max(
+            (shard_meta for _, shard_meta in results),
+            key=lambda m: models.index(ModelType(m["llm_model"])),
+        )
+        meta["source"] = "sharded"
+        meta["llm_model"] = strongest["llm_model"]
+        meta["llm_tier"] = strongest["llm_tier"]
+        meta["escalated"] = any(m["escalated"] for _, m in results)
+        meta["shards"] = [
+            {
+                "pages": [pages[0] + 1, pages[-1] + 1],
+                **shard_meta,
+                "failed": _is_error(result),
+            }
+            for pages, (result, shard_meta) in zip(shards, results, strict=True)
+        ]
+        meta["conflicts"] = conflicts
 
     print("JSON response parsed", flush=True)
 
     return {
         "file_name": file_name,
         "result": data,
-        "meta": {"llm_model": llm_model.value, "source": "gemini-pdf-only"},
+        "meta": meta,
     }
@@ -0,0 +1,104 @@
+import io
+import os
+from typing import BinaryIO
+
+from pypdf import PdfReader, PdfWriter
+
+from app.schemas.preprocess_schemas import PdfInspection
+
+# Pages with fewer extractable characters than this are treated as scanned
+MIN_TEXT_CHARS_PER_PAGE = int(os.getenv("PDF_MIN_TEXT_CHARS_PER_PAGE", 50))
+
+
+def _as_stream(pdf: bytes | BinaryIO) -> BinaryIO:
+    if isinstance(pdf, bytes):
+        return io.BytesIO(pdf)
+    pdf.seek(0)
+    return pdf
+
+
+def open_pdf(pdf: bytes | BinaryIO) -> PdfReader | None:
+    """
+    Parse a PDF locally, decrypting it with an empty password if needed.
+    Accepts bytes or a seekable binary file. Returns None if it cannot be read.
+    """
+    # Any failure (malformed file, unsupported encryption, a missing crypto
+    # dependency) just means the PDF is sent to the LLM as-is
+    try:
+        reader = PdfReader(_as_stream(pdf))
+        if reader.is_encrypted and not reader.decrypt(""):
+            return None
+        return reader
+    except Exception:
+        return None
+
+
+def inspect_pdf(pdf: bytes | BinaryIO) -> PdfInspection:
+    """
+    Report page count, encryption and which pages have a text layer.
+    Text is extracted in layout mode so table columns stay aligned.
+    CPU-bound: call via asyncio.to_thread from async code.
+    """
+    encrypted = False
+    try:
+        reader = PdfReader(_as_stream(pdf))
+        encrypted = reader.is_encrypted
+        if encrypted and not reader.decrypt(""):
+            return PdfInspection(encrypted=True, readable=False)
+        pages = list(reader.pages)
+    except Exception:
+        return PdfInspection(encrypted=encrypted, readable=False)
+
+    text_pages: list[int] = []
+    scanned_pages: list[int] = []
+    page_texts: list[str] = []
+
+    for i, page in enumerate(pages):
+        try:
+            text = page.extract_text(extraction_mode="layout")
+        except Exception:
+            text = ""
+
+        page_texts.append(text)
+        if len(text.strip()) >= MIN_TEXT_CHARS_PER_PAGE:
+            text_pages.append(i)
+        else:
+            scanned_pages.append(i)
+
+    return PdfInspection(
+        page_count=len(pages),
+        encrypted=encrypted,
+        text_pages=text_pages,
+        scanned_pages=scanned_pages,
+        page_texts=page_texts,
+    )
+
+
+def format_page_text(inspection: PdfInspection, pages: list[int]) -> str:
+    """Join the extracted text of the given pages with page markers"""
+    return "\n\n".join(
+        f"--- Page {i + 1} ---\n{inspection.page_texts[i].rstrip()}" for i in pages
+    )
+
+
+def pdf_subset(pdf: bytes | BinaryIO, pages: list[int]) -> bytes:
+    """
+    Build a new PDF containing only the given 0-based pages.
+    Not safe to call concurrently on the same file object.
+    Falls back to the whole PDF if it cannot be split locally.
+    """
+    reader = open_pdf(pdf)
+    if reader is not None:
+        try:
+            writer = PdfWriter()
+            for i in pages:
+                writer.add_page(reader.pages[i])
+
+            buffer = io.BytesIO()
+            writer.write(buffer)
+            return buffer.getvalue()
+        except Exception as e:
+            print(f"Could not split PDF, sending it whole: {e}", flush=True)
+
+    stream = _as_stream(pdf)
+    return stream.read()
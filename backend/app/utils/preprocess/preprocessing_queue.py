@@ -1,40 +1,169 @@
 import asyncio
-from uuid import UUID
+import os
+import socket
+from uuid import UUID, uuid4
 
 from supabase._async.client import AsyncClient
 
+from app.core.deadlines import deadline_scope
+from app.schemas.preprocess_schemas import ExtractionPriority
 from app.services.preprocess_service import PreprocessService
+from app.utils.preprocess.stage_limits import (
+    StageLimits,
+    _env_int,
+    get_worker_count,
+)
+
+LEASE_SECONDS = _env_int("PREPROCESS_LEASE_SECONDS", 300)
+POLL_INTERVAL_SECONDS = _env_int("PREPROCESS_POLL_INTERVAL", 5)
+MAX_ATTEMPTS = _env_int("PREPROCESS_MAX_ATTEMPTS", 3)
+# Default cap on concurrent extractions per tenant across all replicas (0 = none);
+# tenants.extraction_max_concurrency overrides it per tenant
+TENANT_MAX_CONCURRENCY = max(0, int(os.getenv("PREPROCESS_TENANT_MAX_CONCURRENCY", 0)))
+# Waiting this long promotes a queued row one priority lane (starvation guard)
+PRIORITY_AGING_SECONDS = _env_int("PREPROCESS_PRIORITY_AGING_SECONDS", 300)
+# Every LLM call made for one document must finish within this deadline, so a
+# hung provider request fails the extraction instead of holding the worker
+DOCUMENT_DEADLINE_SECONDS = _env_int("PREPROCESS_DOCUMENT_DEADLINE_SECONDS", 900)
 
 
 class PreprocessingQueue:
-    def __init__(self, supabase: AsyncClient):
-        self._queue = asyncio.Queue()
-        self._worker_task = None
-        self.service = PreprocessService(supabase)
+    """
+    Durable extraction queue backed by the extracted_files table.
+
+    The status column is the source of truth: enqueue inserts a "queued" row,
+    the dispatcher claims rows in batches (FOR UPDATE SKIP LOCKED) under an
+    expiring lease, and workers hand claimed rows to the PreprocessService.
+    Claims are ordered by priority lane (interactive, retry, bulk, with aging)
+    and are tenant-fair within a lane (weighted round-robin on tenant_id with
+    optional per-tenant caps), so one tenant's bulk upload cannot starve the
+    others and admin retries skip ahead of bulk ingestion.
+    Several processes or replicas can share one backlog, and rows orphaned
+    by a crash are requeued once their lease expires.
+    """
+
+    def __init__(
+        self,
+        supabase: AsyncClient,
+        num_workers: int | None = None,
+        limits: StageLimits | None = None,
+    ):
+        self._queue: asyncio.Queue[UUID] = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._in_flight: set[UUID] = set()
+        self._tasks: list[asyncio.Task] = []
+        self.num_workers = num_workers or get_worker_count()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self.service = PreprocessService(supabase, limits or StageLimits())
 
     async def start_worker(self):
-        """Start background worker"""
-        if self._worker_task is None:
-            self._worker_task = asyncio.create_task(self._worker())
+        """Recover orphaned work, then start the dispatcher, heartbeat and workers"""
+        if self._tasks:
+            return
+
+        requeued = await self.service.requeue_expired_extractions(MAX_ATTEMPTS)
+        if requeued:
+            print(f"Requeued {requeued} orphaned extractions", flush=True)
+
+        self._tasks = [
+            asyncio.create_task(self._dispatcher()),
+            asyncio.create_task(self._heartbeat()),
+            *(
+                asyncio.create_task(self._worker(worker_id))
+                for worker_id in range(self.num_workers)
+            ),
+        ]
+
+    async def stop_worker(self):
+        """Stop all tasks and hand unfinished extractions back to the queue"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.service.release_extraction_leases(self.worker_id)
+
+    async def _dispatcher(self):
+        """Claim queued rows from the database whenever workers have capacity"""
+        polls_per_recovery = max(1, LEASE_SECONDS // POLL_INTERVAL_SECONDS)
+        polls = 0
+
+        while True:
+            self._wakeup.clear()
+            try:
+                polls += 1
+                if polls % polls_per_recovery == 0:
+                    await self.service.requeue_expired_extractions(MAX_ATTEMPTS)
+
+                capacity = self.num_workers - len(self._in_flight)
+                if capacity > 0:
+                    claimed = await self.service.claim_queued_extractions(
+                        self.worker_id,
+                        capacity,
+                        LEASE_SECONDS,
+                        TENANT_MAX_CONCURRENCY,
+                        PRIORITY_AGING_SECONDS,
+                    )
+                    for extracted_file_id in claimed:
+                        self._in_flight.add(extracted_file_id)
+                        self._queue.put_nowait(extracted_file_id)
 
-    async def _worker(self):
-        """Process items sequentially"""
+                    # A full batch means more rows are likely waiting
+                    if claimed and len(claimed) == capacity:
+                        continue
+            except Exception as e:
+                print(f"Failed to claim extractions: {e}", flush=True)
+
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), timeout=POLL_INTERVAL_SECONDS
+                )
+            except TimeoutError:
+                pass
+
+    async def _heartbeat(self):
+        """Keep leases on in-flight rows alive while they are being processed"""
+        while True:
+            await asyncio.sleep(max(1, LEASE_SECONDS // 3))
+            if not self._in_flight:
+                continue
+            try:
+                await self.service.renew_extraction_leases(
+                    self.worker_id, list(self._in_flight), LEASE_SECONDS
+                )
+            except Exception as e:
+                print(f"Failed to renew extraction leases: {e}", flush=True)
+
+    async def _worker(self, worker_id: int):
+        """Process claimed items one at a time; the pool runs several of these"""
 
         while True:
             extracted_file_id = await self._queue.get()
             try:
-                print(f"Processing {extracted_file_id}", flush=True)
-                await self.service.process_pdf_upload(extracted_file_id)
-                print(f"Completed {extracted_file_id}", flush=True)
+                print(
+                    f"[worker {worker_id}] Processing {extracted_file_id}", flush=True
+                )
+                with deadline_scope(DOCUMENT_DEADLINE_SECONDS):
+                    await self.service.process_pdf_upload(extracted_file_id)
+                print(f"[worker {worker_id}] Completed {extracted_file_id}", flush=True)
             except Exception as e:
-                print(f"Failed {extracted_file_id}: {e}", flush=True)
+                print(
+                    f"[worker {worker_id}] Failed {extracted_file_id}: {e}", flush=True
+                )
             finally:
+                self._in_flight.discard(extracted_file_id)
                 self._queue.task_done()
+                self._wakeup.set()
 
-    async def enqueue(self, file_upload_id: UUID) -> UUID:
-        """Add to queue"""
-        extracted_file_id = await self.service.created_queued_extraction(file_upload_id)
-        await self._queue.put(extracted_file_id)
+    async def enqueue(
+        self,
+        file_upload_id: UUID,
+        priority: ExtractionPriority = ExtractionPriority.BULK,
+    ) -> UUID:
+        """Persist a queued extraction in the given lane and wake the dispatcher"""
+        extracted_file_id = await self.service.created_queued_extraction(
+            file_upload_id, priority
+        )
+        self._wakeup.set()
         return extracted_file_id
 
 
@@ -45,7 +174,18 @@ async def init_queue(supabase: AsyncClient):
     global _queue
     _queue = PreprocessingQueue(supabase)
     await _queue.start_worker()
-    print("Preprocessing Queue Initialized")
+    print(
+        f"Preprocessing Queue Initialized ({_queue.num_workers} workers, "
+        f"id {_queue.worker_id})"
+    )
+
+
+async def shutdown_queue():
+    global _queue
+    if _queue is not None:
+        await _queue.stop_worker()
+        _queue = None
+        print("Preprocessing Queue Stopped")
 
 
 def get_queue() -> PreprocessingQueue:
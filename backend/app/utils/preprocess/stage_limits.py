@@ -0,0 +1,79 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read a positive integer from the environment, falling back to default."""
+    try:
+        value = int(os.getenv(name, default))
+    except ValueError:
+        return default
+    return max(1, value)
+
+
+class ByteBudget:
+    """
+    Caps the total size of PDFs held in memory across all workers.
+
+    A document reserves its in-memory footprint (see extraction_footprint)
+    before extraction and releases it afterwards.
+    A single document larger than the whole budget is still admitted, but only
+    once nothing else is in flight.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.in_use = 0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def reserve(self, num_bytes: int):
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: self.in_use == 0 or self.in_use + num_bytes <= self.max_bytes
+            )
+            self.in_use += num_bytes
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_use -= num_bytes
+                self._condition.notify_all()
+
+
+class StageLimits:
+    """
+    Per-stage concurrency limits shared by every preprocessing worker.
+
+    Workers run whole documents concurrently, but each pipeline stage is
+    bounded separately so that e.g. slow LLM calls cannot starve downloads
+    or flood the database with writes. PDF bytes held in memory are bounded
+    by a global byte budget so bursts of large scans cannot exhaust memory.
+    """
+
+    def __init__(
+        self,
+        download: int | None = None,
+        llm: int | None = None,
+        embedding: int | None = None,
+        db: int | None = None,
+        max_inflight_bytes: int | None = None,
+    ):
+        self.download = asyncio.Semaphore(
+            download or _env_int("PREPROCESS_DOWNLOAD_CONCURRENCY", 4)
+        )
+        self.llm = asyncio.Semaphore(llm or _env_int("PREPROCESS_LLM_CONCURRENCY", 4))
+        self.embedding = asyncio.Semaphore(
+            embedding or _env_int("PREPROCESS_EMBEDDING_CONCURRENCY", 8)
+        )
+        self.db = asyncio.Semaphore(db or _env_int("PREPROCESS_DB_CONCURRENCY", 8))
+        self.pdf_bytes = ByteBudget(
+            max_inflight_bytes
+            or _env_int("PREPROCESS_MAX_INFLIGHT_BYTES", 256 * 1024 * 1024)
+        )
+
+
+def get_worker_count() -> int:
+    """Number of concurrent preprocessing workers (PREPROCESS_WORKERS)."""
+    return _env_int("PREPROCESS_WORKERS", 8)
@@ -95,7 +95,11 @@ export const useClassifications = () => {
         throw new Error('No tenant selected')
       }
 
-      await api.post(`/classification/classify_files/${currentTenant?.id}`)
+      await api.post(
+        `/classification/assign_classifications/${currentTenant?.id}`,
+        null,
+        { params: { reclassify: true } }
+      )
     },
     onSuccess: () => {
       queryClient.invalidateQueries({
@@ -0,0 +1,106 @@
+-- Make extracted_files the durable source of truth for the preprocessing queue.
+-- Workers claim queued rows with leases; expired leases are recovered.
+
+ALTER TABLE extracted_files
+ADD COLUMN lease_owner TEXT,
+ADD COLUMN lease_expires_at TIMESTAMPTZ,
+ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0;
+
+CREATE INDEX idx_extracted_files_queued ON extracted_files(created_at)
+WHERE status = 'queued';
+
+CREATE INDEX idx_extracted_files_processing_lease ON extracted_files(lease_expires_at)
+WHERE status = 'processing';
+
+-- Claim up to batch_size queued rows for a worker.
+-- SKIP LOCKED lets any number of workers/replicas claim concurrently.
+CREATE OR REPLACE FUNCTION claim_extractions(
+    p_worker_id TEXT,
+    p_batch_size INT DEFAULT 1,
+    p_lease_seconds INT DEFAULT 300
+)
+RETURNS TABLE (extracted_file_id UUID, file_upload_id UUID, attempt INT)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    RETURN QUERY
+    WITH claimable AS (
+        SELECT ef.id
+        FROM extracted_files ef
+        WHERE ef.status = 'queued'
+        ORDER BY ef.created_at
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE extracted_files ef
+    SET status = 'processing',
+        lease_owner = p_worker_id,
+        lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+        attempts = ef.attempts + 1,
+        updated_at = NOW()
+    FROM claimable c
+    WHERE ef.id = c.id
+    RETURNING ef.id, ef.source_file_id, ef.attempts;
+END;
+$$;
+
+-- Extend the leases a worker holds on the rows it is still processing.
+CREATE OR REPLACE FUNCTION renew_extraction_leases(
+    p_worker_id TEXT,
+    p_extracted_file_ids UUID[],
+    p_lease_seconds INT DEFAULT 300
+)
+RETURNS INT
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    renewed INT;
+BEGIN
+    UPDATE extracted_files
+    SET lease_expires_at = NOW() + make_interval(secs => p_lease_seconds)
+    WHERE id = ANY(p_extracted_file_ids)
+    AND status = 'processing'
+    AND lease_owner = p_worker_id;
+
+    GET DIAGNOSTICS renewed = ROW_COUNT;
+    RETURN renewed;
+END;
+$$;
+
+-- Recover work orphaned by crashed or redeployed workers.
+-- Rows without a lease are left over from before leases existed.
+-- Rows that exhausted their attempts are marked failed instead of requeued.
+CREATE OR REPLACE FUNCTION requeue_expired_extractions(p_max_attempts INT DEFAULT 3)
+RETURNS INT
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    requeued INT;
+BEGIN
+    UPDATE extracted_files
+    SET status = 'failed',
+        extracted_data = jsonb_build_object(
+            'error', 'Extraction abandoned after ' || attempts || ' attempts'
+        ),
+        lease_owner = NULL,
+        lease_expires_at = NULL,
+        updated_at = NOW()
+    WHERE status = 'processing'
+    AND (lease_expires_at IS NULL OR lease_expires_at < NOW())
+    AND attempts >= p_max_attempts;
+
+    UPDATE extracted_files
+    SET status = 'queued',
+        lease_owner = NULL,
+        lease_expires_at = NULL,
+        updated_at = NOW()
+    WHERE status = 'processing'
+    AND (lease_expires_at IS NULL OR lease_expires_at < NOW());
+
+    GET DIAGNOSTICS requeued = ROW_COUNT;
+    RETURN requeued;
+END;
+$$;
@@ -0,0 +1,80 @@
+-- Tenant-fair claiming for the extraction queue.
+-- Queued rows are claimed in weighted round-robin order across tenants, so a
+-- bulk upload from one tenant cannot make every other tenant wait behind it.
+
+ALTER TABLE tenants
+ADD COLUMN extraction_weight INTEGER NOT NULL DEFAULT 1 CHECK (extraction_weight > 0),
+ADD COLUMN extraction_max_concurrency INTEGER CHECK (extraction_max_concurrency > 0);
+
+DROP FUNCTION IF EXISTS claim_extractions(TEXT, INT, INT);
+
+-- Each tenant's queued rows are ranked oldest first, and rows are claimed in
+-- order of rank / weight (a virtual finish time, as in weighted fair queueing).
+-- A tenant's first queued row therefore only competes with the first rows of
+-- other tenants, however large its neighbours' backlogs are.
+-- Tenants already at their concurrency cap (tenants.extraction_max_concurrency,
+-- else p_tenant_max_concurrency, 0 = uncapped) are skipped. Caps are counted
+-- from live leases, so they hold across replicas; concurrent claimers may
+-- briefly overshoot by one batch.
+CREATE OR REPLACE FUNCTION claim_extractions(
+    p_worker_id TEXT,
+    p_batch_size INT DEFAULT 1,
+    p_lease_seconds INT DEFAULT 300,
+    p_tenant_max_concurrency INT DEFAULT 0
+)
+RETURNS TABLE (extracted_file_id UUID, file_upload_id UUID, attempt INT)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    RETURN QUERY
+    WITH running AS (
+        SELECT fu.tenant_id, COUNT(*) AS in_flight
+        FROM extracted_files ef
+        JOIN file_uploads fu ON fu.id = ef.source_file_id
+        WHERE ef.status = 'processing'
+        AND ef.lease_expires_at > NOW()
+        GROUP BY fu.tenant_id
+    ),
+    ranked AS (
+        SELECT
+            ef.id,
+            ef.created_at,
+            t.extraction_weight AS weight,
+            ROW_NUMBER() OVER (
+                PARTITION BY fu.tenant_id ORDER BY ef.created_at
+            ) AS tenant_rank,
+            COALESCE(
+                t.extraction_max_concurrency,
+                NULLIF(p_tenant_max_concurrency, 0)
+            ) - COALESCE(r.in_flight, 0) AS headroom
+        FROM extracted_files ef
+        JOIN file_uploads fu ON fu.id = ef.source_file_id
+        JOIN tenants t ON t.id = fu.tenant_id
+        LEFT JOIN running r ON r.tenant_id = fu.tenant_id
+        WHERE ef.status = 'queued'
+    ),
+    candidates AS (
+        SELECT ranked.id, ranked.tenant_rank, ranked.weight, ranked.created_at
+        FROM ranked
+        WHERE ranked.headroom IS NULL OR ranked.tenant_rank <= ranked.headroom
+    ),
+    claimable AS (
+        SELECT ef.id
+        FROM extracted_files ef
+        JOIN candidates c ON c.id = ef.id
+        ORDER BY (c.tenant_rank - 1)::FLOAT / c.weight, c.created_at
+        LIMIT p_batch_size
+        FOR UPDATE OF ef SKIP LOCKED
+    )
+    UPDATE extracted_files ef
+    SET status = 'processing',
+        lease_owner = p_worker_id,
+        lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+        attempts = ef.attempts + 1,
+        updated_at = NOW()
+    FROM claimable c
+    WHERE ef.id = c.id
+    RETURNING ef.id, ef.source_file_id, ef.attempts;
+END;
+$$;
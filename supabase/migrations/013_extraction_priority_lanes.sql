@@ -0,0 +1,136 @@
+-- Priority lanes for the extraction queue.
+-- 0 = interactive (admin-initiated, e.g. retry_extraction)
+-- 1 = retry (automatic re-attempts of orphaned work)
+-- 2 = bulk (storage upload webhooks)
+
+ALTER TABLE extracted_files
+ADD COLUMN priority SMALLINT NOT NULL DEFAULT 2 CHECK (priority BETWEEN 0 AND 2);
+
+DROP FUNCTION IF EXISTS claim_extractions(TEXT, INT, INT, INT);
+
+-- Lower lanes are claimed first. To prevent starvation a row is promoted one
+-- lane for every p_aging_seconds it has waited, so bulk work always drains.
+-- Aging stops at the retry lane: lane 0 holds only interactive rows, so an
+-- admin retry is never queued behind a tenant's aged bulk backlog.
+-- Within a lane rows are claimed tenant-fairly (rank / weight, see 012).
+-- Interactive rows are not subject to per-tenant concurrency caps.
+CREATE OR REPLACE FUNCTION claim_extractions(
+    p_worker_id TEXT,
+    p_batch_size INT DEFAULT 1,
+    p_lease_seconds INT DEFAULT 300,
+    p_tenant_max_concurrency INT DEFAULT 0,
+    p_aging_seconds INT DEFAULT 300
+)
+RETURNS TABLE (extracted_file_id UUID, file_upload_id UUID, attempt INT)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    RETURN QUERY
+    WITH running AS (
+        SELECT fu.tenant_id, COUNT(*) AS in_flight
+        FROM extracted_files ef
+        JOIN file_uploads fu ON fu.id = ef.source_file_id
+        WHERE ef.status = 'processing'
+        AND ef.lease_expires_at > NOW()
+        GROUP BY fu.tenant_id
+    ),
+    queued AS (
+        SELECT
+            ef.id,
+            ef.created_at,
+            ef.priority,
+            fu.tenant_id,
+            t.extraction_weight AS weight,
+            CASE WHEN ef.priority = 0 THEN 0 ELSE GREATEST(
+                1,
+                ef.priority - FLOOR(
+                    EXTRACT(EPOCH FROM NOW() - ef.created_at)
+                    / GREATEST(p_aging_seconds, 1)
+                )::INT
+            ) END AS lane,
+            COALESCE(
+                t.extraction_max_concurrency,
+                NULLIF(p_tenant_max_concurrency, 0)
+            ) - COALESCE(r.in_flight, 0) AS headroom
+        FROM extracted_files ef
+        JOIN file_uploads fu ON fu.id = ef.source_file_id
+        JOIN tenants t ON t.id = fu.tenant_id
+        LEFT JOIN running r ON r.tenant_id = fu.tenant_id
+        WHERE ef.status = 'queued'
+    ),
+    ranked AS (
+        SELECT
+            queued.*,
+            ROW_NUMBER() OVER (
+                PARTITION BY queued.tenant_id, queued.lane
+                ORDER BY queued.created_at
+            ) AS lane_rank,
+            ROW_NUMBER() OVER (
+                PARTITION BY queued.tenant_id, queued.priority = 0
+                ORDER BY queued.lane, queued.created_at
+            ) AS tenant_rank
+        FROM queued
+    ),
+    candidates AS (
+        SELECT ranked.id, ranked.lane, ranked.lane_rank, ranked.weight,
+            ranked.created_at
+        FROM ranked
+        WHERE ranked.priority = 0
+        OR ranked.headroom IS NULL
+        OR ranked.tenant_rank <= ranked.headroom
+    ),
+    claimable AS (
+        SELECT ef.id
+        FROM extracted_files ef
+        JOIN candidates c ON c.id = ef.id
+        ORDER BY c.lane, (c.lane_rank - 1)::FLOAT / c.weight, c.created_at
+        LIMIT p_batch_size
+        FOR UPDATE OF ef SKIP LOCKED
+    )
+    UPDATE extracted_files ef
+    SET status = 'processing',
+        lease_owner = p_worker_id,
+        lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+        attempts = ef.attempts + 1,
+        updated_at = NOW()
+    FROM claimable c
+    WHERE ef.id = c.id
+    RETURNING ef.id, ef.source_file_id, ef.attempts;
+END;
+$$;
+
+-- Orphaned rows go back to the queue in the retry lane (or stay interactive).
+CREATE OR REPLACE FUNCTION requeue_expired_extractions(p_max_attempts INT DEFAULT 3)
+RETURNS INT
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    requeued INT;
+BEGIN
+    UPDATE extracted_files
+    SET status = 'failed',
+        extracted_data = jsonb_build_object(
+            'error', 'Extraction abandoned after ' || attempts || ' attempts'
+        ),
+        lease_owner = NULL,
+        lease_expires_at = NULL,
+        updated_at = NOW()
+    WHERE status = 'processing'
+    AND (lease_expires_at IS NULL OR lease_expires_at < NOW())
+    AND attempts >= p_max_attempts;
+
+    UPDATE extracted_files
+    SET status = 'queued',
+        priority = LEAST(priority, 1),
+        lease_owner = NULL,
+        lease_expires_at = NULL,
+        updated_at = NOW()
+    WHERE status = 'processing'
+    AND (lease_expires_at IS NULL OR lease_expires_at < NOW());
+
+    GET DIAGNOSTICS requeued = ROW_COUNT;
+    RETURN requeued;
+END;
+$$;
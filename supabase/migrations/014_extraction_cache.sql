@@ -0,0 +1,15 @@
+-- Content-addressed cache of PDF extractions.
+-- Identical PDF bytes extracted with the same model and system prompt reuse
+-- the stored result and embedding instead of calling the LLM again.
+CREATE TABLE IF NOT EXISTS extraction_cache (
+    content_sha256 TEXT NOT NULL,
+    llm_model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    extracted_data JSONB NOT NULL,
+    embedding vector(768),
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (content_sha256, llm_model, prompt_version)
+);
+
+-- Backend-only table: RLS with no policies restricts it to the service role
+ALTER TABLE extraction_cache ENABLE ROW LEVEL SECURITY;
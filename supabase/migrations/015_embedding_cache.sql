@@ -0,0 +1,13 @@
+-- Persistent embedding cache shared by all backend processes.
+-- Keyed on the model, output dimensions and SHA-256 of the embedded text.
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    embedding_model TEXT NOT NULL,
+    dimensions INTEGER NOT NULL,
+    text_sha256 TEXT NOT NULL,
+    embedding vector NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (embedding_model, dimensions, text_sha256)
+);
+
+-- Backend-only table: RLS with no policies restricts it to the service role
+ALTER TABLE embedding_cache ENABLE ROW LEVEL SECURITY;
@@ -0,0 +1,7 @@
+-- Persist each classification's name embedding so classifying files
+-- does not re-embed every classification name on every request.
+-- embedding_model records which model produced the vector; rows embedded
+-- by a different model are re-embedded by the backend.
+ALTER TABLE classifications
+ADD COLUMN IF NOT EXISTS embedding vector(768),
+ADD COLUMN IF NOT EXISTS embedding_model TEXT;
@@ -0,0 +1,52 @@
+-- Assign files to their nearest classification inside Postgres.
+-- Each extracted file is matched against the tenant's stored classification
+-- embeddings with pgvector cosine distance (<=>), and file_uploads is updated
+-- in one set-based statement, so embeddings never leave the database.
+-- By default only unclassified files are assigned; p_only_unclassified =>
+-- FALSE reassigns every file. Returns the number of files whose
+-- classification changed.
+CREATE OR REPLACE FUNCTION assign_nearest_classifications(
+    p_tenant_id UUID,
+    p_only_unclassified BOOLEAN DEFAULT TRUE
+)
+RETURNS INT
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    assigned INT;
+BEGIN
+    WITH latest_extractions AS (
+        -- A file may have several extractions; use its newest embedding
+        SELECT DISTINCT ON (ef.source_file_id)
+            ef.source_file_id,
+            ef.embedding
+        FROM extracted_files ef
+        JOIN file_uploads fu ON fu.id = ef.source_file_id
+        WHERE fu.tenant_id = p_tenant_id
+          AND ef.embedding IS NOT NULL
+          AND (NOT p_only_unclassified OR fu.classification_id IS NULL)
+        ORDER BY ef.source_file_id, ef.created_at DESC
+    ),
+    nearest AS (
+        SELECT le.source_file_id, best.id AS classification_id
+        FROM latest_extractions le
+        CROSS JOIN LATERAL (
+            SELECT c.id
+            FROM classifications c
+            WHERE c.tenant_id = p_tenant_id
+              AND c.embedding IS NOT NULL
+            ORDER BY c.embedding <=> le.embedding, c.created_at, c.id
+            LIMIT 1
+        ) best
+    )
+    UPDATE file_uploads fu
+    SET classification_id = n.classification_id
+    FROM nearest n
+    WHERE fu.id = n.source_file_id
+      AND fu.classification_id IS DISTINCT FROM n.classification_id;
+
+    GET DIAGNOSTICS assigned = ROW_COUNT;
+    RETURN assigned;
+END;
+$$;
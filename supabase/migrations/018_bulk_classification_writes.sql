@@ -0,0 +1,151 @@
+-- Bulk classification writes.
+-- Applying classifications one PostgREST request per file is one round trip
+-- (and one trigger-time tenant lookup) per document. bulk_classify_files
+-- applies any number of assignments in one statement, and the tenant check
+-- runs once per statement over the whole set.
+
+-- Validate tenant ownership set-wise: one statement-level trigger per event
+-- checks every row the statement wrote (the transition table) in a single
+-- join, instead of a per-row lookup. Updates only check rows whose
+-- classification or tenant changed. The check cannot be bypassed.
+CREATE OR REPLACE FUNCTION check_classification_tenant()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        IF EXISTS (
+            SELECT 1
+            FROM new_rows n
+            LEFT JOIN classifications c
+                ON c.id = n.classification_id AND c.tenant_id = n.tenant_id
+            WHERE n.classification_id IS NOT NULL AND c.id IS NULL
+        ) THEN
+            RAISE EXCEPTION 'Classification must belong to the same tenant as the file';
+        END IF;
+    ELSE
+        IF EXISTS (
+            SELECT 1
+            FROM new_rows n
+            JOIN old_rows o ON o.id = n.id
+            LEFT JOIN classifications c
+                ON c.id = n.classification_id AND c.tenant_id = n.tenant_id
+            WHERE n.classification_id IS NOT NULL
+              AND (
+                  n.classification_id IS DISTINCT FROM o.classification_id
+                  OR n.tenant_id IS DISTINCT FROM o.tenant_id
+              )
+              AND c.id IS NULL
+        ) THEN
+            RAISE EXCEPTION 'Classification must belong to the same tenant as the file';
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS validate_file_classification ON file_uploads;
+
+-- Transition tables need one trigger per event
+CREATE TRIGGER validate_file_classification
+    AFTER INSERT ON file_uploads
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION check_classification_tenant();
+
+CREATE TRIGGER validate_file_classification_update
+    AFTER UPDATE ON file_uploads
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION check_classification_tenant();
+
+-- Apply (file_upload_id, classification_id) assignments for one tenant.
+-- The arrays are parallel; a NULL classification unclassifies the file.
+-- Every classification must belong to the tenant (checked once, set-wise);
+-- files outside the tenant are ignored. Returns the number of files changed.
+CREATE OR REPLACE FUNCTION bulk_classify_files(
+    p_tenant_id UUID,
+    p_file_upload_ids UUID[],
+    p_classification_ids UUID[]
+)
+RETURNS INT
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    updated INT;
+BEGIN
+    IF cardinality(p_file_upload_ids) <> cardinality(p_classification_ids) THEN
+        RAISE EXCEPTION 'File and classification arrays must have the same length';
+    END IF;
+
+    IF EXISTS (
+        SELECT 1
+        FROM unnest(p_classification_ids) AS a(classification_id)
+        LEFT JOIN classifications c
+            ON c.id = a.classification_id AND c.tenant_id = p_tenant_id
+        WHERE a.classification_id IS NOT NULL AND c.id IS NULL
+    ) THEN
+        RAISE EXCEPTION 'Classification must belong to the same tenant as the file';
+    END IF;
+
+    UPDATE file_uploads fu
+    SET classification_id = a.classification_id
+    FROM unnest(p_file_upload_ids, p_classification_ids)
+        AS a(file_upload_id, classification_id)
+    WHERE fu.id = a.file_upload_id
+      AND fu.tenant_id = p_tenant_id
+      AND fu.classification_id IS DISTINCT FROM a.classification_id;
+
+    GET DIAGNOSTICS updated = ROW_COUNT;
+
+    RETURN updated;
+END;
+$$;
+
+-- Nearest-classification assignment as one statement, so the tenant check
+-- runs once for the whole tenant.
+CREATE OR REPLACE FUNCTION assign_nearest_classifications(
+    p_tenant_id UUID,
+    p_only_unclassified BOOLEAN DEFAULT TRUE
+)
+RETURNS INT
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    assigned INT;
+BEGIN
+    WITH latest_extractions AS (
+        -- A file may have several extractions; use its newest embedding
+        SELECT DISTINCT ON (ef.source_file_id)
+            ef.source_file_id,
+            ef.embedding
+        FROM extracted_files ef
+        JOIN file_uploads fu ON fu.id = ef.source_file_id
+        WHERE fu.tenant_id = p_tenant_id
+          AND ef.embedding IS NOT NULL
+          AND (NOT p_only_unclassified OR fu.classification_id IS NULL)
+        ORDER BY ef.source_file_id, ef.created_at DESC
+    ),
+    nearest AS (
+        SELECT le.source_file_id, best.id AS classification_id
+        FROM latest_extractions le
+        CROSS JOIN LATERAL (
+            SELECT c.id
+            FROM classifications c
+            WHERE c.tenant_id = p_tenant_id
+              AND c.embedding IS NOT NULL
+            ORDER BY c.embedding <=> le.embedding, c.created_at, c.id
+            LIMIT 1
+        ) best
+    )
+    UPDATE file_uploads fu
+    SET classification_id = n.classification_id
+    FROM nearest n
+    WHERE fu.id = n.source_file_id
+      AND fu.classification_id IS DISTINCT FROM n.classification_id;
+
+    GET DIAGNOSTICS assigned = ROW_COUNT;
+
+    RETURN assigned;
+END;
+$$;
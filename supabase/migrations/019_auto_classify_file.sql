@@ -0,0 +1,43 @@
+-- Classify a single newly extracted file against its tenant's stored
+-- classification embeddings (pgvector cosine distance). Used right after an
+-- extraction completes, so the work per upload is independent of tenant size.
+-- Files that already have a classification are left alone. Returns the
+-- assigned classification id, or NULL if nothing was assigned.
+CREATE OR REPLACE FUNCTION assign_nearest_classification(
+    p_file_upload_id UUID
+)
+RETURNS UUID
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    assigned UUID;
+BEGIN
+    WITH latest_extraction AS (
+        SELECT ef.embedding
+        FROM extracted_files ef
+        WHERE ef.source_file_id = p_file_upload_id
+          AND ef.embedding IS NOT NULL
+        ORDER BY ef.created_at DESC
+        LIMIT 1
+    ),
+    nearest AS (
+        SELECT c.id
+        FROM file_uploads fu
+        JOIN classifications c ON c.tenant_id = fu.tenant_id
+        CROSS JOIN latest_extraction le
+        WHERE fu.id = p_file_upload_id
+          AND c.embedding IS NOT NULL
+        ORDER BY c.embedding <=> le.embedding, c.created_at, c.id
+        LIMIT 1
+    )
+    UPDATE file_uploads fu
+    SET classification_id = n.id
+    FROM nearest n
+    WHERE fu.id = p_file_upload_id
+      AND fu.classification_id IS NULL
+    RETURNING fu.classification_id INTO assigned;
+
+    RETURN assigned;
+END;
+$$;
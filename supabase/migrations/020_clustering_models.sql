@@ -0,0 +1,23 @@
+-- Persisted per-tenant clustering models.
+-- The fitted HDBSCAN clusterer (with prediction data), its pre-reduction and
+-- the label of every document are stored as an artifact in the
+-- clustering-models bucket; this table records where, plus a fingerprint of
+-- the document set, so new documents can be assigned incrementally instead
+-- of refitting on every create_classifications call.
+-- 50 MiB cap (CLUSTERING_MODEL_MAX_BYTES); larger models are not persisted
+INSERT INTO storage.buckets (id, name, public, file_size_limit)
+VALUES ('clustering-models', 'clustering-models', false, 52428800)
+ON CONFLICT (id) DO UPDATE SET file_size_limit = EXCLUDED.file_size_limit;
+
+CREATE TABLE IF NOT EXISTS clustering_models (
+    tenant_id UUID PRIMARY KEY REFERENCES tenants(id) ON DELETE CASCADE,
+    storage_path TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    document_count INTEGER NOT NULL,
+    fitted_count INTEGER NOT NULL,
+    cluster_count INTEGER NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Backend-only table: RLS with no policies restricts it to the service role
+ALTER TABLE clustering_models ENABLE ROW LEVEL SECURITY;
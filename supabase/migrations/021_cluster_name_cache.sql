@@ -0,0 +1,18 @@
+-- Cluster name cache.
+-- Each named cluster is stored with a MinHash signature of its member
+-- extracted_file_ids. On the next create_classifications run a cluster whose
+-- estimated Jaccard similarity to a cached one clears the threshold reuses
+-- its name instead of asking the LLM again.
+CREATE TABLE IF NOT EXISTS cluster_names (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    tenant_id UUID NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+    signature INTEGER[] NOT NULL,
+    name TEXT NOT NULL,
+    member_count INTEGER NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX idx_cluster_names_tenant_id ON cluster_names(tenant_id);
+
+-- Backend-only table: RLS with no policies restricts it to the service role
+ALTER TABLE cluster_names ENABLE ROW LEVEL SECURITY;
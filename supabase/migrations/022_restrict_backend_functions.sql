@@ -0,0 +1,24 @@
+-- Backend-only RPCs.
+-- These SECURITY DEFINER functions take a tenant or worker id from the
+-- caller and bypass RLS, and functions are executable by PUBLIC (and, in
+-- Supabase, anon/authenticated) by default. Only the backend's service role
+-- may call them.
+REVOKE EXECUTE ON FUNCTION bulk_classify_files(UUID, UUID[], UUID[])
+    FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION assign_nearest_classifications(UUID, BOOLEAN)
+    FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION assign_nearest_classification(UUID)
+    FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION claim_extractions(TEXT, INT, INT, INT, INT)
+    FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION renew_extraction_leases(TEXT, UUID[], INT)
+    FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION requeue_expired_extractions(INT)
+    FROM PUBLIC, anon, authenticated;
+
+GRANT EXECUTE ON FUNCTION bulk_classify_files(UUID, UUID[], UUID[]) TO service_role;
+GRANT EXECUTE ON FUNCTION assign_nearest_classifications(UUID, BOOLEAN) TO service_role;
+GRANT EXECUTE ON FUNCTION assign_nearest_classification(UUID) TO service_role;
+GRANT EXECUTE ON FUNCTION claim_extractions(TEXT, INT, INT, INT, INT) TO service_role;
+GRANT EXECUTE ON FUNCTION renew_extraction_leases(TEXT, UUID[], INT) TO service_role;
+GRANT EXECUTE ON FUNCTION requeue_expired_extractions(INT) TO service_role;